@@ -0,0 +1,237 @@
+"""
+Audio capture decoupled from LED rendering.
+
+Captured blocks of samples go into a preallocated ring buffer - pushed
+straight from the PyAudio callback for the microphone, or read by a capture
+thread for other sources - and the render loop analyses the most recent
+window of samples at its own frame rate. Newest data wins: older samples are
+overwritten rather than queued, so a slow frame never stalls the stream or
+delays the light behind the sound, and the frame rate is no longer limited
+to one frame per audio chunk.
+"""
+
+import queue
+import threading
+import wave
+
+import numpy as np
+
+
+class audio_ring_buffer():
+    """Fixed-capacity ring of int16 samples with one writer and one reader.
+
+    Positions are counted in samples written since creation, so the reader can
+    tell whether anything new has arrived and how much it missed.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.lock = threading.Lock()
+
+        self.write_position = 0  # total samples written
+        self.read_position = 0   # write_position when the reader last read
+        self.overruns = 0        # writes that overwrote samples never read
+        self.overrun_samples = 0
+
+    def write(self, samples):
+        """Append samples, overwriting the oldest ones when full."""
+        samples = samples[-self.capacity:]
+        count = len(samples)
+        with self.lock:
+            start = self.write_position % self.capacity
+            first = min(count, self.capacity - start)
+            self.buffer[start:start + first] = samples[:first]
+            self.buffer[:count - first] = samples[first:]
+            self.write_position += count
+
+            unread = self.write_position - self.read_position
+            if unread > self.capacity:
+                self.overruns += 1
+                self.overrun_samples += unread - self.capacity
+                self.read_position = self.write_position - self.capacity
+
+    def has_new_samples(self):
+        """Return True if samples were written since the last read."""
+        return self.write_position != self.read_position
+
+    def read_latest(self, out):
+        """Copy the most recent len(out) samples into out, oldest first.
+
+        Returns:
+            False if fewer than len(out) samples have been written so far.
+        """
+        count = len(out)
+        with self.lock:
+            if count > min(self.write_position, self.capacity):
+                return False
+            end = self.write_position % self.capacity
+            start = (end - count) % self.capacity
+            if start < end:
+                out[:] = self.buffer[start:end]
+            else:
+                first = self.capacity - start
+                out[:first] = self.buffer[start:]
+                out[first:] = self.buffer[:end]
+            self.read_position = self.write_position
+        return True
+
+    def stats(self):
+        """Return the buffer counters as a dictionary."""
+        return {
+            'samples_written': self.write_position,
+            'overruns': self.overruns,
+            'overrun_samples': self.overrun_samples,
+        }
+
+
+class capture_history(audio_ring_buffer):
+    """Bounded history of captured audio, optionally spilled to a WAV file.
+
+    Only the most recent capacity samples are kept in memory, so memory use
+    stays flat however long an effect runs. When wav_path is given every
+    sample is also streamed to that file (16-bit mono) for later analysis.
+
+    The file is written by a background thread fed through a bounded queue,
+    since write() runs on the audio callback and must never wait for the
+    disk. If the disk falls behind by more than wav_queue_blocks blocks,
+    further blocks are left out of the file and counted in
+    wav_dropped_blocks.
+    """
+    def __init__(self, capacity, rate, wav_path=None, wav_queue_blocks=256):
+        super().__init__(capacity)
+        self.rate = rate
+        self.wav_path = wav_path
+        self.wav_file = None
+        self.wav_queue = None
+        self.wav_thread = None
+        self.wav_dropped_blocks = 0
+
+        if wav_path is not None:
+            self.wav_file = wave.open(wav_path, 'wb')
+            self.wav_file.setnchannels(1)
+            self.wav_file.setsampwidth(2)
+            self.wav_file.setframerate(rate)
+            self.wav_queue = queue.Queue(maxsize=wav_queue_blocks)
+            self.wav_thread = threading.Thread(target=self.run_wav_writer, daemon=True)
+            self.wav_thread.start()
+
+    def write(self, samples):
+        """Keep samples in the history and queue them for the WAV file."""
+        super().write(samples)
+        wav_queue = self.wav_queue
+        if wav_queue is not None:
+            try:
+                wav_queue.put_nowait(samples.tobytes())
+            except queue.Full:
+                self.wav_dropped_blocks += 1
+
+    def run_wav_writer(self):
+        # Until close() queues None
+        while True:
+            data = self.wav_queue.get()
+            if data is None:
+                break
+            self.wav_file.writeframes(data)
+
+    def retained_samples(self):
+        """Return a copy of the retained audio, oldest sample first."""
+        out = np.zeros(min(self.write_position, self.capacity), dtype=np.int16)
+        self.read_latest(out)
+        return out
+
+    def stats(self):
+        """Return the buffer and WAV spill counters as a dictionary."""
+        stats = super().stats()
+        stats['wav_dropped_blocks'] = self.wav_dropped_blocks
+        return stats
+
+    def close(self):
+        """Write out the queued blocks and finish the WAV file, if any."""
+        if self.wav_thread is not None:
+            self.wav_queue.put(None)
+            self.wav_thread.join()
+            self.wav_thread = None
+            self.wav_queue = None
+        if self.wav_file is not None:
+            self.wav_file.close()
+            self.wav_file = None
+
+
+class audio_capture():
+    """Captures an audio source into an audio_ring_buffer.
+
+    Sources that push their audio (add_consumer(), e.g. the callback mode
+    microphone) write straight into the ring; anything that has to be read
+    is read by a background thread instead.
+    """
+    def __init__(self, stream, block_size, capacity, history=None):
+        """
+        Args:
+            stream: audio source of int16 mono samples (see audio_sources.py)
+            block_size: samples per stream.read()
+            capacity: ring buffer size in samples
+            history: optional capture_history that every block is written to
+        """
+        self.stream = stream
+        self.block_size = block_size
+        self.ring = audio_ring_buffer(capacity)
+        self.history = history
+        self.read_errors = 0
+
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Start capturing, in a background (daemon) thread if needed."""
+        self.stop_event.clear()
+        if hasattr(self.stream, 'add_consumer'):
+            self.stream.add_consumer(self)
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop capturing and wait for the thread to finish."""
+        self.stop_event.set()
+        if hasattr(self.stream, 'remove_consumer'):
+            self.stream.remove_consumer(self)
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+
+    def run(self):
+        # Wait for real-time sources on the stop event rather than blocking
+        # inside read(), so stop() never waits for a block of audio to arrive
+        time_until_available = getattr(self.stream, 'time_until_available', None)
+
+        while not self.stop_event.is_set():
+            if time_until_available is not None:
+                if self.stop_event.wait(time_until_available(self.block_size)):
+                    break
+            try:
+                data = self.stream.read(self.block_size, exception_on_overflow=False)
+            except OSError as e:
+                # Handle stream errors gracefully (e.g., during switching)
+                self.read_errors += 1
+                print(f"Audio stream read error: {e}")
+                self.stop_event.wait(0.01)
+                continue
+
+            self.write(np.frombuffer(data, dtype=np.int16))
+
+    def write(self, samples):
+        """Store a block of captured samples."""
+        if self.history is not None:
+            self.history.write(samples)
+        self.ring.write(samples)
+
+    def stats(self):
+        """Return the capture counters as a dictionary."""
+        stats = self.ring.stats()
+        stats['read_errors'] = self.read_errors
+        if self.history is not None and self.history.wav_path is not None:
+            stats['wav_dropped_blocks'] = self.history.wav_dropped_blocks
+        source_stats = getattr(self.stream, 'stats', None)
+        if source_stats is not None:
+            stats.update(source_stats())
+        return stats
@@ -1,14 +1,18 @@
-import pyaudio
 import numpy as np
 import time
 # from rpi_ws281x import *
 from rpi_ws281x import Adafruit_NeoPixel, Color
 import argparse
-from collections import deque
 import random
+import functools
 
-from collections import deque
-
+from framebuffer import get_framebuffer
+from frame_clock import run_effect
+from audio_capture import audio_capture, capture_history
+from palettes import intensity_palette, map_intensities
+from audio_sources import microphone_source
+from gain_control import auto_gain
+from metrics import hot_path, AUDIO_READ, ANALYSIS, MAPPING
 
 
 # from four_meter import LED_COUNT, LED_PIN, LED_FREQ_HZ
@@ -19,42 +23,47 @@ from collections import deque
 
 # strip.begin()   
 
-CHUNK = 4096 #1024  # Size of a single audio chunk
-FORMAT = pyaudio.paInt16
+CHUNK = 4096 #1024  # Size of a single audio chunk (the analysis window)
+CAPTURE_BLOCK = 1024  # Samples per read by the capture thread
+MIC_BLOCK = 256  # Samples per PyAudio callback, bounds the capture latency (~5 ms at 48 kHz)
+CAPTURE_SECONDS = 1  # Audio kept in the capture ring buffer
+AUDIO_FRAME_RATE = 60  # Render rate of the audio effects
+STFT_WINDOW = 2048  # Analysis window of the short-hop (STFT) frequency mode
+STFT_HOP = 256  # Samples between analyses in the STFT mode (~5 ms at 48 kHz)
+MIN_WINDOW = 2  # Shortest analysis window with a frequency bin above DC
 CHANNELS = 1
 RATE = 48000 # 16000 for video mic
-RECORD_SECONDS = 30
+RECORD_SECONDS = 30  # Audio retained in the capture history
+RECORD_WAV_PATH = None  # Set to a file path to also stream captured audio to a WAV file
 USB_MIC_INDEX = 0  # **CHANGE THIS to your device's index**
 
 # Global audio stream variables - initialized by init_audio_stream()
-p = None
-stream = None
-frames = []
+stream = None  # microphone_source
+frames = None  # capture_history of the most recent RECORD_SECONDS of audio
 
 
 def init_audio_stream():
     """Initialize the audio stream for microphone input."""
-    global p, stream, frames
+    global stream, frames
     
-    if p is None:
-        p = pyaudio.PyAudio()
-        stream = p.open(format=FORMAT,
-                        channels=CHANNELS,
-                        rate=RATE,
-                        input=True,
-                        frames_per_buffer=CHUNK,
-                        input_device_index=USB_MIC_INDEX)
-        frames = []
+    if stream is None:
+        stream = microphone_source(RATE, MIC_BLOCK, device_index=USB_MIC_INDEX)
+        frames = capture_history(RECORD_SECONDS * RATE, RATE,
+                                 wav_path=RECORD_WAV_PATH)
         print("Audio stream initialized and listening...")
     else:
-        # Stream exists, clear any overflow by reading pending data
+        # Stream exists, clear any pending data (a no-op in callback mode)
         clear_audio_buffer()
     
     return stream
 
 
 def clear_audio_buffer():
-    """Clear any pending audio data in the buffer to prevent overflow."""
+    """Clear any pending audio data in the buffer to prevent overflow.
+
+    The microphone runs in callback mode, so nothing ever backs up there;
+    this only matters for sources that are read on demand.
+    """
     global stream
     
     if stream is not None and stream.is_active():
@@ -70,31 +79,38 @@ def clear_audio_buffer():
 
 def close_audio_stream():
     """Close the audio stream and terminate PyAudio."""
-    global p, stream
+    global stream, frames
     
     if stream is not None:
         try:
             # Give some time for any pending reads to complete
             time.sleep(0.1)
-            stream.stop_stream()
             stream.close()
         except Exception as e:
             print(f"Error closing audio stream: {e}")
         finally:
             stream = None
-    
-    if p is not None:
-        try:
-            p.terminate()
-        except Exception as e:
-            print(f"Error terminating PyAudio: {e}")
-        finally:
-            p = None
+
+    if frames is not None:
+        frames.close()
+        frames = None
     
     print("Audio stream closed.")
 
 
 MAX_LOUDNESS = 2**14 -1  #  15 is Maximum for int16
+# Both effects scale against levels that follow the input (gain_control.py)
+# rather than a fixed maximum. Attack and release are in seconds; the floors
+# are the lowest reference levels, so background noise stays dark.
+LOUDNESS_ATTACK = 0.5
+LOUDNESS_RELEASE = 2.0
+LOUDNESS_FLOOR = 300  # peak sample value
+LOUDNESS_HEADROOM = 2.6  # a peak at the running level lights 1/2.6 of the strip
+SPECTRUM_ATTACK = 0.1
+SPECTRUM_RELEASE = 4.0
+SPECTRUM_FLOOR = 5000  # mean FFT magnitude of a band
+SPECTRUM_HEADROOM = 1.2
+SPECTRUM_BAND_RANGE = 20  # quietest band reference, relative to the loudest
 back_color = Color(150,0,150) # Purple
 fore_colour = Color(200,200,0) # Yellow
 
@@ -113,35 +129,74 @@ def set_all(strip, color):
 
     """Set all pixels to the same color."""
 
-    for i in range(strip.numPixels()):
-
-        strip.setPixelColor(i, color)
-
-    strip.show()
+    frame = get_framebuffer(strip)
+    frame.fill(color)
+    frame.show()
 
 
 
 class audio_led_connector():
     """Class to connect audio data to LED patterns.
-        The pattern fuction should take audio data as input
-        and a strip object to update. Then return an array
-        of LED colors.
+        The stream can be any audio source from audio_sources.py.
+        The pattern fuction should take the latest CHUNK of audio
+        samples (an int16 array) and this connector as input.
+        Then return an array of LED colors.
+
+        Audio is captured into a ring buffer by its own thread while
+        the LEDs are rendered at AUDIO_FRAME_RATE from the most recent
+        window_length samples. When hop_size is given the audio is
+        captured and analysed every hop_size samples instead, with
+        overlapping windows.
     """
     def __init__(self, strip, stream,
-                 pattern_function ):
+                 pattern_function, history=None,
+                 window_length=CHUNK, hop_size=None, gain=None ):
         self.strip = strip
+        self.frame = get_framebuffer(strip)
         self.stream = stream
-        self.max_array = deque(maxlen=100)
+        self.rate = getattr(stream, 'rate', RATE)
+        # auto_gain the pattern scales its measurements with (by default
+        # the loudness effect's)
+        if gain is None:
+            gain = auto_gain(1, LOUDNESS_ATTACK, LOUDNESS_RELEASE, LOUDNESS_FLOOR,
+                             headroom=LOUDNESS_HEADROOM)
+        self.gain = gain
+        self.loudness = np.zeros(1)
         self.pattern_function = pattern_function
+        self.window_length = window_length
+        self.hop_size = hop_size
+
+        if hop_size:
+            self.frame_period = hop_size / self.rate
+            block_size = min(CAPTURE_BLOCK, hop_size)
+        else:
+            self.frame_period = 1 / AUDIO_FRAME_RATE
+            block_size = CAPTURE_BLOCK
 
-    def update_leds(self):
+        self.capture = audio_capture(stream, block_size,
+                                     CAPTURE_SECONDS * self.rate, history=history)
+        self.audio_data = np.zeros(window_length, dtype=np.int16)
 
-        the_leds = self.pattern_function(self.stream, self.strip, self)
+    def step(self):
+        # Only re-analyse when the capture thread has delivered new audio
+        if not self.capture.ring.has_new_samples():
+            return
+        start = time.perf_counter()
+        if not self.capture.ring.read_latest(self.audio_data):
+            return
+        hot_path.record(AUDIO_READ, time.perf_counter() - start)
 
-        for i, colour in enumerate(the_leds):
-            self.strip.setPixelColor(i, colour)
+        the_leds = self.pattern_function(self.audio_data, self)
 
-        self.strip.show()
+        self.frame.pixels[:len(the_leds)] = the_leds
+
+    def start(self):
+        """Start capturing audio, for driving step() from outside run()."""
+        self.capture.start()
+
+    def stop(self):
+        """Stop capturing audio."""
+        self.capture.stop()
 
     def run(self, stop_event=None):
         """Run the audio effect continuously until stop_event is set.
@@ -149,14 +204,36 @@ class audio_led_connector():
         Args:
             stop_event: threading.Event that signals when to stop the effect
         """
-        while not (stop_event and stop_event.is_set()):
-            self.update_leds()
-            # Small delay to prevent overwhelming the audio buffer
-            time.sleep(0.001)  # 1ms delay
+        self.start()
+        try:
+            run_effect(self, stop_event)
+        finally:
+            self.stop()
 
+    def audio_stats(self):
+        """Return the capture counters and the gain control's levels as a dictionary."""
+        return {**self.capture.stats(), 'gain': self.gain.stats()}
 
 
 
+
+def check_analysis(window_length, hop_size, rate):
+    """Check the analysis window and hop of a frequency effect.
+
+    The window needs MIN_WINDOW samples, so the spectrum has a bin above DC
+    for the bands to cover, and has to fit in the capture ring buffer
+    (CAPTURE_SECONDS of audio); the hop, if any, has to fit in the window.
+
+    Raises:
+        ValueError: if either is out of range
+    """
+    capacity = CAPTURE_SECONDS * rate
+    if not MIN_WINDOW <= window_length <= capacity:
+        raise ValueError(f'window must be {MIN_WINDOW} to {capacity} samples, not {window_length}')
+    if hop_size is not None and not 0 < hop_size <= window_length:
+        raise ValueError(f'hop must be 1 to {window_length} samples (the window), not {hop_size}')
+
+
 def calculate_log_bins(num_leds, min_freq, max_freq):
     """
     Calculates the logarithmic frequency cutoff points for an array of LEDs.
@@ -195,11 +272,19 @@ def calculate_log_bins(num_leds, min_freq, max_freq):
 class freq_audio_connector(audio_led_connector):
     """ 
     Sub class to connect frequency audio data to LED patterns.
+
+    By default each analysis is a rectangular window of the latest CHUNK
+    samples. With hop_size set (the STFT mode, e.g. window_length=STFT_WINDOW,
+    hop_size=STFT_HOP) overlapping Hann-windowed analyses run every hop_size
+    samples, for low latency without losing low-frequency resolution.
     """
     def __init__(self, strip, stream,
-                 pattern_function ):
+                 pattern_function, window_length=CHUNK, hop_size=None,
+                 attack=SPECTRUM_ATTACK, release=SPECTRUM_RELEASE ):
         # Get LED count from the strip object
         LED_COUNT = strip.numPixels()
+        rate = getattr(stream, 'rate', RATE)
+        check_analysis(window_length, hop_size, rate)
         
         # divide the frequency ranges up for each LED
         # self.freq_thresholds = [
@@ -207,85 +292,92 @@ class freq_audio_connector(audio_led_connector):
         #                      RATE // 2,
         #                      int((RATE / 2) / LED_COUNT))
         # ]
-        self.freq_thresholds = calculate_log_bins(LED_COUNT, 40, RATE // 2)
+        self.freq_thresholds = calculate_log_bins(LED_COUNT, 40, rate // 2)
         # assuming that the size of the array will only
         # different by one
         if len(self.freq_thresholds) > LED_COUNT:
             self.freq_thresholds = self.freq_thresholds[:LED_COUNT]
-            self.freq_thresholds[-1] = RATE // 2
+            self.freq_thresholds[-1] = rate // 2
         if len(self.freq_thresholds) < LED_COUNT:
-            self.freq_thresholds.append(RATE // 2)
-
+            self.freq_thresholds.append(rate // 2)
+
+
+        # Shared colour lookup table indexed by intensity: 0 is off, then
+        # the brightness ramp of each colour in COLOUR_SEQUENCE in turn
+        self.colour_table = intensity_palette(COLOUR_SEQUENCE)
+        self.max_intensity = len(self.colour_table) - 1
+
+        # FFT bin index where each LED's frequency band starts, plus the end
+        # of the last band. Bands narrower than one FFT bin are empty.
+        index_thresholds = np.floor(np.asarray(self.freq_thresholds) / (rate / window_length)).astype(int)
+        self.bin_edges = np.minimum(np.insert(index_thresholds, 0, 0), window_length // 2)
+        bin_widths = np.diff(self.bin_edges)
+        self.nonempty_bands = np.flatnonzero(bin_widths > 0)
+        self.band_starts = self.bin_edges[self.nonempty_bands]
+        self.band_widths = bin_widths[self.nonempty_bands]
+
+        # Preallocated per-frame buffers
+        self.band_means = np.zeros(len(self.nonempty_bands), dtype=float)
+        self.led_intensity = np.zeros(LED_COUNT + 1, dtype=np.intp)
+        self.led_positions = np.arange(1, LED_COUNT + 1)
+        self.last_lit = np.zeros(LED_COUNT, dtype=np.intp)
+
+        # Reused FFT input/output buffers, and in the STFT mode a precomputed
+        # (periodic) Hann window
+        self.fft_input = np.zeros(window_length, dtype=float)
+        self.spectrum = np.zeros(window_length // 2 + 1, dtype=complex)
+        self.fft_magnitude = np.zeros(window_length // 2 + 1, dtype=float)
+        if hop_size:
+            self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(window_length) / window_length)
+        else:
+            self.window = None
+        # Keep magnitudes on the scale of a rectangular CHUNK-sample window,
+        # which SPECTRUM_FLOOR was chosen for
+        window_sum = window_length if self.window is None else self.window.sum()
+        self.magnitude_scale = CHUNK / window_sum
 
-        intensity_space = 255 * len(COLOUR_SEQUENCE)
-        colour_sizes = MAX_LOUDNESS // len(COLOUR_SEQUENCE)
+        # Reference level per non-empty band, following the input
+        gain = auto_gain(len(self.nonempty_bands), attack, release, SPECTRUM_FLOOR,
+                         headroom=SPECTRUM_HEADROOM, band_range=SPECTRUM_BAND_RANGE)
 
-        self.output_colour_sequence = []
-        for col in COLOUR_SEQUENCE:
-            for j in range(0,255):
-                r = col[0] * j 
-                g = col[1] * j                 
-                b = col[2] * j 
-                self.output_colour_sequence.append(Color(r, g, b))
         print("Audio frequency effect initialized")
         # print(self.output_colour_sequence[0:260])
 
         super().__init__(strip, stream,
-                 pattern_function )
+                 pattern_function, window_length=window_length, hop_size=hop_size,
+                 gain=gain )
         
-    def update_leds(self):
-
-        the_leds = self.pattern_function(self.stream, self.freq_thresholds, self)
-
-        for i, colour in enumerate(the_leds):
-            self.strip.setPixelColor(i, colour)
-
-        self.strip.show()
 
 
 
+@functools.lru_cache(maxsize=8)
+def loudness_positions(led_count):
+    """Return the position value that audio_led_loudness_pattern compares
+    against the bar length for each LED: counting down from the centre to 1
+    on the first half, then up from the centre on the second half."""
+    half_led_count = int(led_count / 2)
+    positions = np.concatenate((np.arange(half_led_count, 0, -1),
+                                np.arange(half_led_count, led_count)))
+    positions.flags.writeable = False
+    return positions
 
-def audio_led_loudness_pattern(stream, strip, self):
-    # for i in range(0, int(RATE / CHUNK * RECORD_SECONDS)):
-    try:
-        data = stream.read(CHUNK, exception_on_overflow=False)
-    except OSError as e:
-        # Handle stream errors gracefully (e.g., during switching)
-        print(f"Audio stream read error: {e}")
-        # Return all LEDs off
-        LED_COUNT = strip.numPixels()
-        return [Color(0, 0, 0)] * LED_COUNT
-    
-    frames.append(data)
-    # Process the raw 'data' here, e.g., convert to numpy array:
-    audio_data = np.frombuffer(data, dtype=np.int16)
 
-    avg = np.mean(np.abs(audio_data))
-    max = np.max(np.abs(audio_data))
-    self.max_array.append(max)
+def audio_led_loudness_pattern(audio_data, self):
+    start = time.perf_counter()
+    strip = self.strip
 
-    avmax = int(np.mean(self.max_array) * 1.3)
+    self.loudness[0] = np.max(np.abs(audio_data))
 
-
-    HALF_LED_COUNT = int(strip.numPixels() /2)
     LED_COUNT = strip.numPixels()
-    # num_leds = int((avg / MAX_LOUDNESS) * LED_COUNT)
-    num_leds = int((max / avmax) * HALF_LED_COUNT)
-
+    # the peak relative to its running level (times the headroom), 0 to 1
+    num_leds = int(self.gain.normalise(self.loudness)[0] * LED_COUNT)
+    analysed = time.perf_counter()
+    hot_path.record(ANALYSIS, analysed - start)
 
-    the_leds = []
-    for i in range(HALF_LED_COUNT, 0, -1):
-        if i < num_leds:
-            the_leds.append(fore_colour)
-        else:
-            the_leds.append(back_color)
-
-    for i in range(HALF_LED_COUNT, LED_COUNT):
-        if i < num_leds:
-            the_leds.append(fore_colour)
-        else:
-            the_leds.append(back_color)
-        
+    # Light every LED whose distance from the centre is below num_leds
+    the_leds = np.where(loudness_positions(LED_COUNT) < num_leds,
+                        fore_colour, back_color).astype(np.uint32)
+    hot_path.record(MAPPING, time.perf_counter() - analysed)
 
     return the_leds
 
@@ -295,110 +387,138 @@ def audio_led_loudness_pattern(stream, strip, self):
 
 
 
-def gem_audio_led_freq_pattern(stream, freq_thresholds, self):
-    # 1. Read data (same)
-    try:
-        data = stream.read(CHUNK, exception_on_overflow=False)
-    except OSError as e:
-        # Handle stream errors gracefully (e.g., during switching)
-        print(f"Audio stream read error: {e}")
-        # Return all LEDs off
-        LED_COUNT = self.strip.numPixels()
-        return [Color(0, 0, 0)] * LED_COUNT
-    
-    audio_data = np.frombuffer(data, dtype=np.int16)
-
-    # 2. Apply FFT (same)
-    fft_result = np.fft.fft(audio_data)
-    # We only care about the first half (positive frequencies)
-    fft_magnitude = np.abs(fft_result[:CHUNK//2])
-    
-    # 3. Create the frequency indices for faster lookups
-    # These are the indices that correspond to the frequency thresholds
-    # We only need to calculate this once outside the main loop if possible
-    # but calculating here is fine.
-    # Note: We use the floor to find the index corresponding to the threshold frequency
-    index_thresholds = np.floor(freq_thresholds / (RATE / CHUNK) ).astype(int)
-    # Add index 0 to the start
-    index_thresholds = np.insert(index_thresholds, 0, 0)
-    
-    LED_COUNT = self.strip.numPixels()
-    the_leds = []
-    last_colour = Color(0,0,0)
-    
-    # Iterate through the LED segments (frequency bins)
-    for idx in range(LED_COUNT):
-        # Determine the start and end indices for this LED's frequency bin
-        start_index = index_thresholds[idx]
-        end_index = index_thresholds[idx+1]
-        
-        # SLICING: Get all magnitudes within this bin using a single operation
-        bin_magnitudes = fft_magnitude[start_index:end_index]
-        
-        # VECTORIZED MEAN: Calculate the average magnitude for the bin
-        if len(bin_magnitudes) == 0:
-            this_led_intensity = 0
-        else:
-            # We use the MEAN magnitude instead of SUM to normalize for bin width
-            avg_magnitude = np.mean(bin_magnitudes)
-            
-            # Use a pre-determined maximum for consistent scaling (e.g., 200000)
-            # The FFT magnitude maximum is device/volume dependent. You'll need 
-            # to tune the max_ref value below.
-            MAX_MAGNITUDE_REF = 100000 # <-- **TUNE THIS VALUE**
-            
-            # Simple scaling to get a value between 0 and 1
-            intensity_ratio = avg_magnitude / MAX_MAGNITUDE_REF
-            # Clamp the ratio between 0 and 1
-            intensity_ratio = np.clip(intensity_ratio, 0.0, 1.0)
-            
-            this_led_intensity = int(intensity_ratio * len(self.output_colour_sequence))
-
-        # 4. Color Mapping (Simplified)
-        # Simplified color mapping without a complex sequence lookup
-        
-        if this_led_intensity > 0:
-            # Hue-based mapping (example: green for low, red for high intensity)
-            #colour = Color(this_led_intensity, 255 - this_led_intensity, 0)
-            colour = self.output_colour_sequence[this_led_intensity -1]
-            last_colour = colour
-        else:
-            colour = last_colour
-            
-        the_leds.append(colour)
-
+def gem_audio_led_freq_pattern(audio_data, self):
+    start = time.perf_counter()
+    # 1. Real FFT into reused buffers - we only care about the positive frequencies
+    if self.window is not None:
+        np.multiply(audio_data, self.window, out=self.fft_input)
+    else:
+        self.fft_input[:] = audio_data
+    np.fft.rfft(self.fft_input, out=self.spectrum)
+    np.abs(self.spectrum, out=self.fft_magnitude)
+    if self.magnitude_scale != 1:
+        self.fft_magnitude *= self.magnitude_scale
+    fft_magnitude = self.fft_magnitude[:self.bin_edges[-1]]
+
+    # 2. Average magnitude of every non-empty band in one segmented reduction.
+    # Bands are contiguous, so each sum runs up to the start of the next one.
+    # We use the MEAN magnitude instead of SUM to normalize for bin width
+    np.add.reduceat(fft_magnitude, self.band_starts, out=self.band_means)
+    self.band_means /= self.band_widths
+
+    # 3. Scale to an intensity between 0 and the length of the colour sequence,
+    # relative to each band's running level
+    intensity_ratio = self.gain.normalise(self.band_means)
+    # led_intensity[0] stays 0 and stands for "no LED lit yet"
+    led_intensity = self.led_intensity
+    led_intensity[1:] = 0
+    led_intensity[self.nonempty_bands + 1] = (intensity_ratio * self.max_intensity).astype(np.intp)
+
+    # 4. LEDs with no intensity repeat the colour of the last lit LED before
+    # them, so carry forward the position of the last lit LED
+    np.multiply(self.led_positions, led_intensity[1:] > 0, out=self.last_lit)
+    np.maximum.accumulate(self.last_lit, out=self.last_lit)
+    analysed = time.perf_counter()
+    hot_path.record(ANALYSIS, analysed - start)
+
+    # 5. Colour mapping with one gather from the colour table
+    the_leds = map_intensities(self.colour_table, led_intensity[self.last_lit])
+    hot_path.record(MAPPING, time.perf_counter() - analysed)
     return the_leds
 
 
 # Factory functions to create audio effect controllers
-def create_loudness_controller(strip):
+def create_loudness_controller(strip, source=None, attack=LOUDNESS_ATTACK,
+                               release=LOUDNESS_RELEASE):
     """Create a loudness-based audio LED controller.
     
     Args:
         strip: The LED strip object
+        source: audio source from audio_sources.py (default: the microphone)
+        attack: seconds the gain control takes to follow a louder level
+        release: seconds it takes to fall back to a quieter one
         
     Returns:
         audio_led_connector instance configured for loudness detection
     """
+    gain = auto_gain(1, attack, release, LOUDNESS_FLOOR, headroom=LOUDNESS_HEADROOM)
+    if source is not None:
+        return audio_led_connector(strip, source, audio_led_loudness_pattern, gain=gain)
+
     # Initialize audio stream if needed
     audio_stream = init_audio_stream()
     
-    return audio_led_connector(strip, audio_stream, audio_led_loudness_pattern)
+    return audio_led_connector(strip, audio_stream, audio_led_loudness_pattern,
+                               history=frames, gain=gain)
 
 
-def create_frequency_controller(strip):
+def create_frequency_controller(strip, source=None, window_length=CHUNK, hop_size=None,
+                                attack=SPECTRUM_ATTACK, release=SPECTRUM_RELEASE):
     """Create a frequency-based audio LED controller.
     
     Args:
         strip: The LED strip object
+        source: audio source from audio_sources.py (default: the microphone)
+        window_length: samples per analysis window
+        hop_size: samples between overlapping analyses (None: analyse the
+                  latest window once per frame at AUDIO_FRAME_RATE)
+        attack: seconds the gain control takes to follow a louder band
+        release: seconds it takes to fall back to a quieter one
         
     Returns:
         freq_audio_connector instance configured for frequency analysis
     """
+    if source is not None:
+        return freq_audio_connector(strip, source, gem_audio_led_freq_pattern,
+                                    window_length, hop_size, attack, release)
+
     # Initialize audio stream if needed
     audio_stream = init_audio_stream()
     
-    return freq_audio_connector(strip, audio_stream, gem_audio_led_freq_pattern)
+    return freq_audio_connector(strip, audio_stream, gem_audio_led_freq_pattern,
+                                window_length, hop_size, attack, release)
+
+
+
+# Factories of the effects in effect_registry.py
+
+def gain_times(params, attack, release):
+    """Return the attack and release from params, or the given defaults where not set."""
+    return (attack if params.get('attack') is None else params['attack'],
+            release if params.get('release') is None else params['release'])
+
+
+def create_loudness_effect(target, params):
+    clear_audio_buffer()  # Clear any pending audio data
+    attack, release = gain_times(params, LOUDNESS_ATTACK, LOUDNESS_RELEASE)
+    return create_loudness_controller(target, attack=attack, release=release)
+
+
+def create_frequency_effect(target, params):
+    clear_audio_buffer()  # Clear any pending audio data
+    attack, release = gain_times(params, SPECTRUM_ATTACK, SPECTRUM_RELEASE)
+    return create_frequency_controller(target, attack=attack, release=release)
+
+
+def stft_params(params):
+    """Return the window and hop of the STFT effect's params, or their defaults."""
+    window = params.get('window')
+    hop = params.get('hop')
+    return (STFT_WINDOW if window is None else window,
+            STFT_HOP if hop is None else hop)
+
+
+def check_stft_params(params):
+    """Check of the STFT effect's parameters, run by effect_registry before it is queued."""
+    check_analysis(*stft_params(params), RATE)
+
+
+def create_stft_frequency_effect(target, params):
+    clear_audio_buffer()  # Clear any pending audio data
+    window, hop = stft_params(params)
+    attack, release = gain_times(params, SPECTRUM_ATTACK, SPECTRUM_RELEASE)
+    return create_frequency_controller(target, window_length=window, hop_size=hop,
+                                       attack=attack, release=release)
 
 
 # Main execution block (for standalone testing)
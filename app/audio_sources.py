@@ -0,0 +1,238 @@
+"""
+Audio sources for the audio-reactive effects.
+
+Sources have a sample rate (rate) and deliver 16-bit mono samples either by
+being read like a PyAudio input stream - read(num_samples) returns
+num_samples * 2 bytes - or, for the microphone, by pushing every block to
+the consumers registered with add_consumer(). audio_capture handles both:
+
+- microphone_source: live input through PyAudio, in callback mode
+- wav_file_source:   playback of a WAV file, in real time or as fast as possible
+- sine_sweep_source, pink_noise_source, click_track_source: synthetic signals
+
+Non-microphone sources are deterministic, so a recorded gig or a test signal
+can be replayed exactly when profiling or comparing versions on a machine
+with no sound card.
+"""
+
+import time
+import wave
+
+import numpy as np
+
+
+class microphone_source():
+    """Live microphone input through PyAudio in callback mode.
+
+    PortAudio calls on_audio() with every block as soon as it is captured and
+    the block is handed straight to the registered consumers (which copy it
+    into their preallocated ring buffers). Nothing is queued up waiting for a
+    blocking read, so however long a frame takes to render the consumer
+    always analyses the newest audio and older backlog is simply overwritten.
+    """
+    def __init__(self, rate, frames_per_buffer, device_index=None):
+        import pyaudio
+
+        self.rate = rate
+        self.consumers = ()
+        self.input_overflows = 0
+        self.input_underflows = 0
+        self._overflow_flag = pyaudio.paInputOverflow
+        self._underflow_flag = pyaudio.paInputUnderflow
+        self._continue = pyaudio.paContinue
+
+        self.pyaudio = pyaudio.PyAudio()
+        self.stream = self.pyaudio.open(format=pyaudio.paInt16,
+                                        channels=1,
+                                        rate=rate,
+                                        input=True,
+                                        frames_per_buffer=frames_per_buffer,
+                                        input_device_index=device_index,
+                                        stream_callback=self.on_audio)
+
+    def on_audio(self, in_data, frame_count, time_info, status_flags):
+        """PyAudio stream callback, runs on PortAudio's thread."""
+        if status_flags & self._overflow_flag:
+            self.input_overflows += 1
+        if status_flags & self._underflow_flag:
+            self.input_underflows += 1
+
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        for consumer in self.consumers:
+            consumer.write(samples)
+        return (None, self._continue)
+
+    def add_consumer(self, consumer):
+        """Deliver every captured block to consumer.write(samples)."""
+        # replace rather than mutate, so the callback can iterate without a lock
+        self.consumers = self.consumers + (consumer,)
+
+    def remove_consumer(self, consumer):
+        self.consumers = tuple(c for c in self.consumers if c is not consumer)
+
+    def is_active(self):
+        return self.stream is not None and self.stream.is_active()
+
+    def get_read_available(self):
+        # nothing ever backs up in callback mode
+        return 0
+
+    def stats(self):
+        """Return the PortAudio overflow/underflow counters as a dictionary."""
+        return {
+            'input_overflows': self.input_overflows,
+            'input_underflows': self.input_underflows,
+        }
+
+    def close(self):
+        """Stop the stream and terminate PyAudio."""
+        try:
+            if self.stream is not None:
+                self.stream.stop_stream()
+                self.stream.close()
+        finally:
+            self.stream = None
+            if self.pyaudio is not None:
+                self.pyaudio.terminate()
+                self.pyaudio = None
+
+
+class generated_source():
+    """Base class for sources that produce their samples in software.
+
+    Subclasses implement generate(num_samples) returning an int16 array. In
+    real-time mode read() blocks until the samples would have arrived from a
+    sound card, otherwise it returns immediately.
+    """
+    def __init__(self, rate, realtime=True):
+        self.rate = rate
+        self.realtime = realtime
+        self.samples_read = 0
+        self.start_time = None
+
+    def generate(self, num_samples):
+        raise NotImplementedError
+
+    def read(self, num_samples, exception_on_overflow=False):
+        samples = self.generate(num_samples)
+        self.samples_read += num_samples
+
+        if self.realtime:
+            now = time.monotonic()
+            if self.start_time is None:
+                self.start_time = now
+            delay = self.start_time + self.samples_read / self.rate - now
+            if delay > 0:
+                time.sleep(delay)
+
+        return samples.astype(np.int16).tobytes()
+
+    def is_active(self):
+        return True
+
+    def get_read_available(self):
+        if not self.realtime or self.start_time is None:
+            return 0
+        due = int((time.monotonic() - self.start_time) * self.rate)
+        return max(due - self.samples_read, 0)
+
+    def time_until_available(self, num_samples):
+        """Return how long a read of num_samples would block, in seconds."""
+        if not self.realtime or self.start_time is None:
+            return 0.0
+        due = self.start_time + (self.samples_read + num_samples) / self.rate
+        return max(due - time.monotonic(), 0.0)
+
+    def close(self):
+        pass
+
+
+class wav_file_source(generated_source):
+    """Plays a 16-bit WAV file, mixed down to mono."""
+    def __init__(self, path, realtime=True, loop=True):
+        with wave.open(path, 'rb') as wav_file:
+            if wav_file.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit WAV files are supported")
+            channels = wav_file.getnchannels()
+            rate = wav_file.getframerate()
+            data = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+
+        super().__init__(rate, realtime)
+        self.path = path
+        self.loop = loop
+        self.samples = data.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        self.position = 0
+        self.finished = False
+
+    def generate(self, num_samples):
+        out = np.zeros(num_samples, dtype=np.int16)
+        filled = 0
+        while filled < num_samples and not self.finished:
+            take = min(num_samples - filled, len(self.samples) - self.position)
+            out[filled:filled + take] = self.samples[self.position:self.position + take]
+            filled += take
+            self.position += take
+            if self.position >= len(self.samples):
+                if self.loop and len(self.samples):
+                    self.position = 0
+                else:
+                    # play silence after the end of the file
+                    self.finished = True
+        return out
+
+
+class sine_sweep_source(generated_source):
+    """Logarithmic sine sweep from start_freq to end_freq, repeating."""
+    def __init__(self, rate, start_freq=40, end_freq=16000, sweep_seconds=10,
+                 amplitude=8000, realtime=True):
+        super().__init__(rate, realtime)
+        self.start_freq = start_freq
+        self.end_freq = end_freq
+        self.sweep_seconds = sweep_seconds
+        self.amplitude = amplitude
+        self.phase = 0.0
+
+    def generate(self, num_samples):
+        t = ((self.samples_read + np.arange(num_samples)) / self.rate) % self.sweep_seconds
+        freq = self.start_freq * (self.end_freq / self.start_freq) ** (t / self.sweep_seconds)
+        # integrate the frequency to keep the phase continuous between reads
+        phase = self.phase + np.cumsum(2 * np.pi * freq / self.rate)
+        self.phase = phase[-1] % (2 * np.pi)
+        return self.amplitude * np.sin(phase)
+
+
+class pink_noise_source(generated_source):
+    """Pink (1/f) noise from a precomputed loop of period_seconds."""
+    def __init__(self, rate, amplitude=4000, seed=0, period_seconds=10, realtime=True):
+        super().__init__(rate, realtime)
+        rng = np.random.default_rng(seed)
+        length = int(rate * period_seconds)
+
+        # shape white noise to a 1/f power spectrum
+        spectrum = np.fft.rfft(rng.standard_normal(length))
+        freqs = np.fft.rfftfreq(length, 1 / rate)
+        spectrum[1:] /= np.sqrt(freqs[1:])
+        spectrum[0] = 0
+        noise = np.fft.irfft(spectrum, length)
+        self.samples = (noise / np.abs(noise).max() * amplitude).astype(np.int16)
+
+    def generate(self, num_samples):
+        positions = (self.samples_read + np.arange(num_samples)) % len(self.samples)
+        return self.samples[positions]
+
+
+class click_track_source(generated_source):
+    """Metronome clicks: a short decaying tone burst on every beat."""
+    def __init__(self, rate, bpm=120, click_freq=2000, click_seconds=0.02,
+                 amplitude=12000, realtime=True):
+        super().__init__(rate, realtime)
+        self.beat_samples = int(rate * 60 / bpm)
+        t = np.arange(int(rate * click_seconds)) / rate
+        self.click = amplitude * np.sin(2 * np.pi * click_freq * t) * np.exp(-t / (click_seconds / 5))
+
+    def generate(self, num_samples):
+        offsets = (self.samples_read + np.arange(num_samples)) % self.beat_samples
+        out = np.zeros(num_samples)
+        in_click = offsets < len(self.click)
+        out[in_click] = self.click[offsets[in_click]]
+        return out
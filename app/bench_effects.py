@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Headless benchmark suite for the LED effects.
+
+Runs each effect flat out (no frame clock sleeping) on a simulated_strip for a
+range of strip lengths and reports:
+- fps:      frames per second the effect could sustain
+- p50/p99:  frame time (render + upload + show, including waiting for the
+            modelled transfer of the previous frame) in milliseconds
+- render:   median time of step() alone in milliseconds
+- alloc:    mean peak transient memory allocated per frame (tracemalloc)
+
+The audio connectors are fed audio straight into their capture ring buffer,
+so no sound card is needed. By default that is a preallocated loop of a
+beating tone; --audio selects a source from audio_sources.py instead
+(sweep, pink, clicks or the path of a WAV file), read as fast as possible.
+
+With --channels 2 the LEDs are split over two outputs clocked out in
+parallel (multi_channel_strip), so the modelled transfer is half as long.
+
+Usage:
+    python bench_effects.py [--frames 300] [--leds 60 260 1000 5000]
+                            [--effects flame heart_beat] [--no-transfer]
+                            [--audio sweep|pink|clicks|recording.wav]
+                            [--channels 2]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import various_effects as ve
+import audio_effects as ae
+import audio_sources
+from sim_strip import simulated_strip
+
+
+LED_COUNTS = [60, 260, 1000, 5000]
+
+
+def synthetic_audio_blocks(count=64, block_size=ae.CAPTURE_BLOCK, rate=ae.RATE):
+    """Return preallocated blocks of a beating tone plus noise."""
+    rng = np.random.default_rng(0)
+    t = np.arange(count * block_size) / rate
+    signal = (8000 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 2 * t))
+              + rng.standard_normal(len(t)) * 1000)
+    return signal.astype(np.int16).reshape(count, block_size)
+
+
+def make_audio_source(spec):
+    """Return a non-realtime audio source for --audio, or None for the default."""
+    if spec is None:
+        return None
+    if spec == 'sweep':
+        return audio_sources.sine_sweep_source(ae.RATE, realtime=False)
+    if spec == 'pink':
+        return audio_sources.pink_noise_source(ae.RATE, realtime=False)
+    if spec == 'clicks':
+        return audio_sources.click_track_source(ae.RATE, realtime=False)
+    return audio_sources.wav_file_source(spec, realtime=False)
+
+
+class audio_feeder():
+    """Writes one capture block of audio into a connector's ring per frame."""
+    def __init__(self, connector, source=None):
+        self.connector = connector
+        self.source = source
+        self.block_size = connector.capture.block_size
+        self.blocks = synthetic_audio_blocks(block_size=self.block_size)
+        self.position = 0
+
+    def __call__(self):
+        if self.source is not None:
+            block = np.frombuffer(self.source.read(self.block_size), dtype=np.int16)
+            self.connector.capture.ring.write(block)
+            return
+        self.connector.capture.ring.write(self.blocks[self.position])
+        self.position = (self.position + 1) % len(self.blocks)
+
+
+def make_effect(name, strip, audio=None):
+    """Return (effect, before_step) for the named effect on strip."""
+    if name == 'flame':
+        return ve.flame(strip, ve.BACKCOLOUR, ve.OUTER_FLAME_COLOUR, ve.INNER_FLAME_COLOUR), None
+    if name == 'expanding_waves':
+        return ve.expanding_waves(strip, 0.5, ve.BACKCOLOUR, ve.OUTER_FLAME_COLOUR), None
+    if name == 'heart_beat':
+        return ve.heart_beat_effect(strip, ve.NEGATIVE_BEAT_COLOUR, ve.POSITIVE_BEAT_COLOUR), None
+    if name == 'audio_loudness':
+        source = make_audio_source(audio)
+        connector = ae.audio_led_connector(strip, source, ae.audio_led_loudness_pattern)
+        return connector, audio_feeder(connector, source)
+    if name == 'audio_frequency':
+        source = make_audio_source(audio)
+        connector = ae.freq_audio_connector(strip, source, ae.gem_audio_led_freq_pattern)
+        return connector, audio_feeder(connector, source)
+    if name == 'audio_frequency_stft':
+        source = make_audio_source(audio)
+        connector = ae.freq_audio_connector(strip, source, ae.gem_audio_led_freq_pattern,
+                                            ae.STFT_WINDOW, ae.STFT_HOP)
+        return connector, audio_feeder(connector, source)
+    raise ValueError(f"Unknown effect: {name}")
+
+
+EFFECT_NAMES = ['flame', 'expanding_waves', 'heart_beat', 'audio_loudness', 'audio_frequency',
+                'audio_frequency_stft']
+
+
+def time_frames(effect, before_step, frames):
+    """Return arrays of frame times and step() times in seconds."""
+    frame_times = np.zeros(frames)
+    render_times = np.zeros(frames)
+
+    for i in range(frames):
+        if before_step:
+            before_step()
+        start = time.perf_counter()
+        effect.step()
+        rendered = time.perf_counter()
+        effect.frame.show()
+        frame_times[i] = time.perf_counter() - start
+        render_times[i] = rendered - start
+
+    return frame_times, render_times
+
+
+def allocation_per_frame(effect, before_step, frames):
+    """Return the mean peak transient bytes allocated by one frame."""
+    peaks = np.zeros(frames)
+    tracemalloc.start()
+    try:
+        for i in range(frames):
+            if before_step:
+                before_step()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            effect.step()
+            effect.frame.show()
+            peaks[i] = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return peaks.mean()
+
+
+def bench_effect(name, led_count, frames, model_transfer, audio=None, channels=1):
+    """Benchmark one effect at one strip length and return a result row."""
+    strip = simulated_strip(led_count, model_transfer=model_transfer, channels=channels)
+    effect, before_step = make_effect(name, strip, audio)
+
+    # warm up caches and the first full transmission
+    time_frames(effect, before_step, 5)
+
+    frame_times, render_times = time_frames(effect, before_step, frames)
+    alloc = allocation_per_frame(effect, before_step, min(frames, 50))
+
+    return {
+        'effect': name,
+        'leds': led_count,
+        'fps': 1.0 / frame_times.mean(),
+        'p50_ms': np.percentile(frame_times, 50) * 1000,
+        'p99_ms': np.percentile(frame_times, 99) * 1000,
+        'render_ms': np.percentile(render_times, 50) * 1000,
+        'alloc_bytes': alloc,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=300, help='frames to time per case')
+    parser.add_argument('--leds', type=int, nargs='+', default=LED_COUNTS, help='strip lengths')
+    parser.add_argument('--effects', nargs='+', default=EFFECT_NAMES, choices=EFFECT_NAMES)
+    parser.add_argument('--no-transfer', action='store_true',
+                        help='do not model the 800 kHz transfer time of show()')
+    parser.add_argument('--audio', default=None,
+                        help='audio source: sweep, pink, clicks or a WAV file path')
+    parser.add_argument('--channels', type=int, default=1,
+                        help='parallel outputs the LEDs are split over')
+    args = parser.parse_args()
+
+    print(f"{'effect':<20} {'LEDs':>6} {'fps':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'render ms':>10} {'alloc B':>9}")
+    for name in args.effects:
+        for led_count in args.leds:
+            row = bench_effect(name, led_count, args.frames, not args.no_transfer, args.audio,
+                               args.channels)
+            print(f"{row['effect']:<20} {row['leds']:>6} {row['fps']:>9.1f} "
+                  f"{row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} "
+                  f"{row['render_ms']:>10.3f} {row['alloc_bytes']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
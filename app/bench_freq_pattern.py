@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the frequency spectrum to LED mapping.
+
+Compares the per-frame cost of gem_audio_led_freq_pattern against the
+original implementation (full complex FFT, bin edges recomputed every frame
+and a Python loop over every LED) for several strip lengths.
+No LED hardware or sound card is needed.
+
+Usage:
+    python bench_freq_pattern.py [--frames 200]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+from rpi_ws281x import Color
+
+import audio_effects as ae
+
+
+# The fixed reference level the original implementation scaled against
+LEGACY_MAGNITUDE_REF = 100000
+
+
+class bench_strip():
+    """Minimal strip stand-in, only the LED count is needed here."""
+    def __init__(self, num_pixels):
+        self.num_pixels = num_pixels
+
+    def numPixels(self):
+        return self.num_pixels
+
+
+def legacy_freq_pattern(audio_data, freq_thresholds, self):
+    """The per-LED loop gem_audio_led_freq_pattern used to run every frame."""
+    fft_result = np.fft.fft(audio_data)
+    fft_magnitude = np.abs(fft_result[:ae.CHUNK//2])
+
+    index_thresholds = np.floor(freq_thresholds / (ae.RATE / ae.CHUNK) ).astype(int)
+    index_thresholds = np.insert(index_thresholds, 0, 0)
+
+    output_colour_sequence = self.output_colour_sequence
+    LED_COUNT = self.strip.numPixels()
+    the_leds = []
+    last_colour = Color(0,0,0)
+
+    for idx in range(LED_COUNT):
+        bin_magnitudes = fft_magnitude[index_thresholds[idx]:index_thresholds[idx+1]]
+        if len(bin_magnitudes) == 0:
+            this_led_intensity = 0
+        else:
+            intensity_ratio = np.clip(np.mean(bin_magnitudes) / LEGACY_MAGNITUDE_REF, 0.0, 1.0)
+            this_led_intensity = int(intensity_ratio * len(output_colour_sequence))
+
+        if this_led_intensity > 0:
+            colour = output_colour_sequence[this_led_intensity -1]
+            last_colour = colour
+        else:
+            colour = last_colour
+        the_leds.append(colour)
+
+    return the_leds
+
+
+def time_per_frame(function, frames):
+    """Return the mean seconds per call of function over frames calls."""
+    return timeit.timeit(function, number=frames) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200, help='frames to time per case')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    audio_data = (rng.standard_normal(ae.CHUNK) * 4000).astype(np.int16)
+
+    print(f"{'LEDs':>6} {'legacy ms':>10} {'vectorized ms':>14} {'speedup':>8}")
+    for led_count in (60, 260, 1000, 5000):
+        connector = ae.freq_audio_connector(bench_strip(led_count), None,
+                                            ae.gem_audio_led_freq_pattern)
+        # the list of Color values the legacy version indexed into
+        connector.output_colour_sequence = connector.colour_table[1:].tolist()
+
+        legacy = time_per_frame(
+            lambda: legacy_freq_pattern(audio_data, connector.freq_thresholds, connector),
+            args.frames)
+        vectorized = time_per_frame(
+            lambda: ae.gem_audio_led_freq_pattern(audio_data, connector),
+            args.frames)
+
+        print(f"{led_count:>6} {legacy * 1000:>10.3f} {vectorized * 1000:>14.3f} "
+              f"{legacy / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
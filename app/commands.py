@@ -0,0 +1,225 @@
+"""
+Command queue between the HTTP handlers and the LEDs.
+
+Handlers submit commands (start an effect, set a colour, stop) and return
+straight away. One output-owner thread is the only thread that ever drives
+the strip: it runs the commands in order and, in between, the current
+effect's frame loop. Submitting a command interrupts the running effect
+through its stop event, so the owner picks it up within a frame.
+
+Commands that replace the output are coalesced: of the commands waiting
+when the owner gets to them, only the latest one with the same key runs and
+the ones it supersedes are completed without running. Dragging the colour
+picker therefore applies only the newest colour, however many requests it
+fires. Commands submitted together as a batch get a unique_key() each, so
+every one of them runs, in order.
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from metrics import effect_switches, STOP, SWITCH
+
+
+log = logging.getLogger('led_controller')
+
+OUTPUT = 'output'  # coalescing key of commands that replace what the strip shows
+
+_unique_keys = itertools.count(1)
+
+
+def unique_key():
+    """Return a coalescing key no other command has, so the command always runs."""
+    return f'{OUTPUT}-{next(_unique_keys)}'
+
+
+class command():
+    """One submitted command and, once it has run, its result."""
+    def __init__(self, command_id, name, params, key=OUTPUT):
+        self.id = command_id
+        self.name = name
+        self.params = params
+        self.key = key
+        self.submitted = time.perf_counter()
+        self.result = None
+        self.error = None
+        self.superseded_by = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Wait for the command to run (or be superseded); returns False on timeout."""
+        return self.done.wait(timeout)
+
+
+class output_owner():
+    """The thread that owns the strip: runs commands and the current effect."""
+    def __init__(self, handler, on_done=None):
+        """
+        Args:
+            handler: function(name, params) run on the owner thread for every
+                     command, returning a result dictionary or raising
+                     ValueError if invalid. It changes the effect with
+                     set_effect().
+            on_done: optional function(command) called on the owner thread
+                     once a command has run or been superseded
+        """
+        self.handler = handler
+        self.on_done = on_done
+        self.queue = queue.Queue()
+        self.ids = itertools.count(1)
+        self.thread = None
+        self.running = False
+
+        # The current effect, run on this thread until interrupted
+        self.effect = None
+        self.interrupt = threading.Event()
+        self.interrupt_time = None
+
+        self.processed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.last_stop_ms = None
+        self.last_switch_ms = None
+
+    def start(self):
+        """Start the owner thread (daemon) if it is not running yet."""
+        if self.thread is None or not self.thread.is_alive():
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name='output_owner', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the current effect and the owner thread."""
+        if self.thread is not None:
+            self.running = False
+            self.interrupt.set()
+            self.queue.put(None)
+            self.thread.join(timeout=timeout)
+            if self.thread.is_alive():
+                log.warning('output owner thread did not stop cleanly')
+            self.thread = None
+
+    def submit(self, name, params=None, key=OUTPUT, command_id=None):
+        """Queue a command and return it without waiting for it to run.
+
+        Args:
+            command_id: id to give the command (default: the next one)
+        """
+        self.start()
+        if command_id is None:
+            command_id = next(self.ids)
+        cmd = command(command_id, name, params or {}, key)
+        self.queue.put(cmd)
+        if self.interrupt_time is None:
+            self.interrupt_time = time.perf_counter()
+        self.interrupt.set()
+        return cmd
+
+    def set_effect(self, effect):
+        """Make effect (an object with run(stop_event)) the one the owner runs."""
+        self.effect = effect
+
+    def run(self):
+        while self.running:
+            pending = []
+            if self.effect is None:
+                # nothing to show, sleep until a command arrives
+                cmd = self.queue.get()
+                if cmd is None:
+                    break
+                pending.append(cmd)
+
+            self.interrupt.clear()
+            self.process_commands(pending)
+
+            if self.effect is not None and self.running:
+                effect = self.effect
+                try:
+                    effect.run(self.interrupt)
+                except Exception:
+                    # e.g. the audio device went away; keep the owner alive
+                    # and stop running the broken effect
+                    log.exception('effect failed', extra={'effect': type(effect).__name__})
+                    self.failed += 1
+                    if self.effect is effect:
+                        self.effect = None
+                    continue
+                self.effect_stopped(effect)
+
+    def effect_stopped(self, effect):
+        if self.interrupt.is_set():
+            if self.interrupt_time is not None:
+                stop_seconds = time.perf_counter() - self.interrupt_time
+                effect_switches.record(STOP, stop_seconds)
+                self.last_stop_ms = round(stop_seconds * 1000, 3)
+        elif self.effect is effect:
+            # the effect finished by itself
+            self.effect = None
+
+    def process_commands(self, pending):
+        """Run the queued commands, skipping the ones superseded by later ones.
+
+        Args:
+            pending: commands already taken off the queue, run first
+        """
+        self.interrupt_time = None
+        while True:
+            try:
+                cmd = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if cmd is not None:
+                pending.append(cmd)
+
+        latest = {cmd.key: cmd for cmd in pending}
+        for cmd in pending:
+            if latest[cmd.key] is not cmd:
+                cmd.superseded_by = latest[cmd.key].id
+                cmd.result = {'superseded_by': cmd.superseded_by}
+                self.coalesced += 1
+                self.finish(cmd)
+                continue
+
+            previous_effect = self.effect
+            self.execute(cmd)
+            if self.effect is not previous_effect and self.effect is not None:
+                switch_seconds = time.perf_counter() - cmd.submitted
+                effect_switches.record(SWITCH, switch_seconds)
+                self.last_switch_ms = round(switch_seconds * 1000, 3)
+
+    def execute(self, cmd):
+        start = time.perf_counter()
+        try:
+            cmd.result = self.handler(cmd.name, cmd.params)
+            self.processed += 1
+        except Exception as e:
+            cmd.error = str(e)
+            self.failed += 1
+        finally:
+            self.finish(cmd)
+
+        log.info('command finished', extra={
+            'command_id': cmd.id,
+            'command': cmd.name,
+            'params': cmd.params,
+            'queued_ms': round((start - cmd.submitted) * 1000, 3),
+            'run_ms': round((time.perf_counter() - start) * 1000, 3),
+            'error': cmd.error,
+        })
+
+    def finish(self, cmd):
+        cmd.done.set()
+        if self.on_done is not None:
+            self.on_done(cmd)
+
+    def stats(self):
+        """Return the queue counters as a dictionary."""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'processed': self.processed,
+            'failed': self.failed,  # commands that raised and effects that crashed
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,178 @@
+"""
+Compositor for crossfading from one effect to another.
+
+While a crossfade runs, the outgoing and incoming effects keep stepping at
+their own frame periods but draw into off-screen framebuffers (their .frame
+is retargeted), and every frame the compositor blends the two into the
+strip's framebuffer. Once the transition time has passed the incoming effect
+is pointed back at the strip and carries on by itself.
+
+The output owner runs the crossfade again after every interrupt: an
+interrupted fade carries on from where it was, and a finished one goes
+straight to the incoming effect.
+
+Blending works on the packed 0xWWRRGGBB colours directly: two 8-bit channels
+are masked out into each 32-bit lane pair and multiplied by an integer
+weight (0-256) in one go, so a blend is a dozen in-place NumPy integer
+operations over the frame into preallocated arrays, with no per-frame
+allocation.
+"""
+
+import time
+
+import numpy as np
+
+from framebuffer import framebuffer, PIXEL_DTYPE
+from frame_clock import run_effect
+
+
+DEFAULT_FADE_SECONDS = 1.0
+
+LOW_CHANNELS = 0x00FF00FF   # red and blue
+HIGH_CHANNELS = 0xFF00FF00  # white and green
+
+
+class frame_blender():
+    """Blends two frames of packed colours with integer weights."""
+    def __init__(self, num_pixels):
+        self.low_a = np.zeros(num_pixels, dtype=PIXEL_DTYPE)
+        self.low_b = np.zeros(num_pixels, dtype=PIXEL_DTYPE)
+        self.high_a = np.zeros(num_pixels, dtype=PIXEL_DTYPE)
+        self.high_b = np.zeros(num_pixels, dtype=PIXEL_DTYPE)
+
+    def blend(self, a, b, weight, out):
+        """Write a * (256 - weight) / 256 + b * weight / 256 per channel into out.
+
+        Args:
+            a, b: uint32 arrays of packed colours
+            weight: integer from 0 (all a) to 256 (all b)
+            out: uint32 array for the result (may be a or b)
+        """
+        inverse = 256 - weight
+
+        # red and blue: each channel has 16 bits of its lane to grow into,
+        # so both are weighted with a single multiply
+        np.bitwise_and(a, LOW_CHANNELS, out=self.low_a)
+        self.low_a *= inverse
+        np.bitwise_and(b, LOW_CHANNELS, out=self.low_b)
+        self.low_b *= weight
+        self.low_a += self.low_b
+        self.low_a >>= 8
+        self.low_a &= LOW_CHANNELS
+
+        # white and green, shifted down into the same lanes; the weighted
+        # sums end up back in place once the low byte of each lane is masked
+        np.right_shift(a, 8, out=self.high_a)
+        self.high_a &= LOW_CHANNELS
+        self.high_a *= inverse
+        np.right_shift(b, 8, out=self.high_b)
+        self.high_b &= LOW_CHANNELS
+        self.high_b *= weight
+        self.high_a += self.high_b
+        self.high_a &= HIGH_CHANNELS
+
+        np.bitwise_or(self.low_a, self.high_a, out=out)
+
+
+def start_effect_hooks(effect):
+    """Start anything the effect needs to step outside its run() (e.g. audio capture)."""
+    start = getattr(effect, 'start', None)
+    if start is not None:
+        start()
+
+
+def stop_effect_hooks(effect):
+    stop = getattr(effect, 'stop', None)
+    if stop is not None:
+        stop()
+
+
+class crossfade():
+    """Fades from a running effect to a new one, then runs the new one."""
+    def __init__(self, outgoing, incoming, duration=DEFAULT_FADE_SECONDS):
+        """
+        Args:
+            outgoing: effect object currently shown (step(), frame, frame_period)
+            incoming: effect object to fade to
+            duration: transition time in seconds
+        """
+        self.outgoing = outgoing
+        self.incoming = incoming
+        self.duration = duration
+
+        # Blend into the strip's framebuffer, at the faster of the two rates
+        self.frame = incoming.frame
+        self.frame_period = min(outgoing.frame_period, incoming.frame_period)
+
+        num_pixels = len(self.frame.pixels)
+        self.outgoing_frame = framebuffer(None, num_pixels)
+        self.incoming_frame = framebuffer(None, num_pixels)
+        self.blender = frame_blender(num_pixels)
+
+        self.start_time = None
+        self.faded = 0.0     # seconds of the transition already shown
+        self.done = False    # transition over, only the incoming effect runs
+        self.outgoing_due = 0.0
+        self.incoming_due = 0.0
+
+    def weight(self, now):
+        """Return the incoming effect's blend weight (0-256) at time now."""
+        if self.duration <= 0:
+            return 256
+        progress = (now - self.start_time) / self.duration
+        return min(max(int(progress * 256), 0), 256)
+
+    def finished(self):
+        return time.monotonic() - self.start_time >= self.duration
+
+    def step(self):
+        now = time.monotonic()
+
+        # step each effect on its own period, skipping any missed frames
+        if now >= self.outgoing_due:
+            self.outgoing.step()
+            self.outgoing_due = max(self.outgoing_due + self.outgoing.frame_period, now)
+        if now >= self.incoming_due:
+            self.incoming.step()
+            self.incoming_due = max(self.incoming_due + self.incoming.frame_period, now)
+
+        self.blender.blend(self.outgoing_frame.pixels, self.incoming_frame.pixels,
+                           self.weight(now), self.frame.pixels)
+
+    def run(self, stop_event=None):
+        """Run the crossfade, then the incoming effect until stop_event is set.
+
+        Args:
+            stop_event: threading.Event that signals when to stop the effects
+        """
+        if not self.done:
+            self.run_transition(stop_event)
+
+        if self.done and not (stop_event and stop_event.is_set()):
+            self.incoming.run(stop_event)
+
+    def run_transition(self, stop_event):
+        """Run (or, after an interrupt, resume) the fade itself."""
+        if self.start_time is None:
+            # Both effects carry on from what the strip is showing now
+            np.copyto(self.outgoing_frame.pixels, self.frame.pixels)
+            np.copyto(self.incoming_frame.pixels, self.frame.pixels)
+        self.outgoing.frame = self.outgoing_frame
+        self.incoming.frame = self.incoming_frame
+
+        start_effect_hooks(self.outgoing)
+        start_effect_hooks(self.incoming)
+        now = time.monotonic()
+        self.start_time = now - self.faded
+        self.outgoing_due = self.incoming_due = now
+        try:
+            run_effect(self, stop_event, until=self.finished)
+        finally:
+            stop_effect_hooks(self.outgoing)
+            stop_effect_hooks(self.incoming)
+            self.outgoing.frame = self.frame
+            self.incoming.frame = self.frame
+            self.faded = min(time.monotonic() - self.start_time, self.duration)
+            self.done = self.finished()
+            if self.done:
+                np.copyto(self.frame.pixels, self.incoming_frame.pixels)
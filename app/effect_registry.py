@@ -0,0 +1,209 @@
+"""
+Registry of the effects the controller can run.
+
+Each effect declares its name, its parameters and its factory, a
+'module:function' string naming the function that creates it. The module is
+imported the first time the effect is created, so effects nobody selects
+cost nothing at start-up: the audio effects' module and everything it pulls
+in (audio capture, palettes and, once the microphone is opened, PyAudio)
+only load when an audio effect is first started.
+
+A factory is called as factory(target, params), where target is the strip
+(or a zone of it) and params the parameters from parse(), and returns the
+effect object. An effect may also name a check, 'module:function' loaded
+the same way, which parse() calls with the converted parameters to reject
+combinations the effect cannot run with (raising ValueError), so a bad
+request is refused before it is queued.
+
+Usage:
+    register('flame', 'various_effects:create_flame', status_name='flame')
+    spec = get_effect('flame')
+    effect = spec.create(strip, spec.parse(request.args))
+"""
+
+import importlib
+import sys
+
+
+def flag(value):
+    """Convert a JSON boolean or a query string value like '1' or 'false' to a bool."""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f'Not a boolean: {value!r}')
+
+
+def non_negative(value):
+    """Convert a time or other amount that cannot be negative to a float."""
+    value = float(value)
+    if not value >= 0:
+        raise ValueError(f'Negative: {value}')
+    return value
+
+
+class effect_param():
+    """A parameter of an effect, converted from a query string or JSON value."""
+    def __init__(self, name, convert, default=None, description='', required=False):
+        """
+        Args:
+            name: parameter name
+            convert: function converting the raw value (e.g. int, float or flag)
+            default: value when the parameter is not given (None lets the
+                     factory choose)
+            description: what it does, listed by /api/effects
+            required: the effect cannot be started without it
+        """
+        self.name = name
+        self.convert = convert
+        self.default = default
+        self.description = description
+        self.required = required
+
+
+# Every effect takes a crossfade time
+FADE = effect_param('fade', float, 0.0, 'crossfade from the current effect (seconds)')
+
+# The audio effects' automatic gain control (gain_control.py)
+AUDIO_GAIN = (effect_param('attack', non_negative, None, 'time to follow a louder input (seconds)'),
+              effect_param('release', non_negative, None,
+                           'time to fall back after it gets quieter (seconds)'))
+
+
+class effect_spec():
+    """Declaration of one effect; its factory is loaded on first use."""
+    def __init__(self, name, factory, params=(), status_name=None, description='',
+                 check=None):
+        """
+        Args:
+            name: name used by the routes, e.g. /control_led/<name>
+            factory: 'module:function' creating the effect
+            params: effect_params of the effect, besides fade
+            status_name: name reported by /api/status (default: name)
+            description: what the effect shows
+            check: optional 'module:function' checking the parsed parameters
+        """
+        self.name = name
+        self.factory = factory
+        self.check = check
+        self.params = (FADE,) + tuple(params)
+        self.status_name = status_name or name
+        self.description = description
+        self._factory_function = None
+        self._check_function = None
+
+    def parse(self, params):
+        """Convert the effect's parameters, filling in the defaults.
+
+        Raises:
+            ValueError: if a parameter cannot be converted
+        """
+        parsed = {}
+        for param in self.params:
+            value = params.get(param.name)
+            if value is None:
+                if param.required:
+                    raise ValueError(f'{self.name} needs a {param.name} parameter')
+                parsed[param.name] = param.default
+                continue
+            try:
+                parsed[param.name] = param.convert(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid {param.name} for {self.name}: {value!r}')
+
+        if self.check is not None:
+            if self._check_function is None:
+                self._check_function = load_function(self.check)
+            self._check_function(parsed)
+        return parsed
+
+    def load(self):
+        """Import the factory's module (once) and return the factory."""
+        if self._factory_function is None:
+            self._factory_function = load_function(self.factory)
+        return self._factory_function
+
+    def create(self, target, params):
+        """Create the effect drawing on target (the strip or a zone).
+
+        Returns:
+            (name reported by /api/status, effect object)
+        """
+        return self.status_name, self.load()(target, params)
+
+    def info(self):
+        """Return the name, description and parameters, as listed by /api/effects."""
+        return {
+            'name': self.name,
+            'description': self.description,
+            'params': [{'name': param.name, 'default': param.default,
+                        'required': param.required, 'description': param.description}
+                       for param in self.params],
+        }
+
+
+def load_function(reference):
+    """Import the module of a 'module:function' reference and return the function."""
+    module_name, function_name = reference.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+effects = {}  # effect name -> effect_spec, in registration order
+
+
+def register(name, factory, params=(), status_name=None, description='', check=None):
+    """Declare an effect (see effect_spec) and return its spec."""
+    spec = effect_spec(name, factory, params, status_name, description, check)
+    effects[name] = spec
+    return spec
+
+
+def get_effect(name):
+    """Return the spec of the named effect.
+
+    Raises:
+        ValueError: if there is no such effect
+    """
+    spec = effects.get(name)
+    if spec is None:
+        raise ValueError(f'Unknown effect: {name}')
+    return spec
+
+
+def effect_names():
+    """Return the names of the registered effects."""
+    return list(effects)
+
+
+def loaded_module(name):
+    """Return the module if an effect (or anything else) has imported it, else None."""
+    return sys.modules.get(name)
+
+
+register('heart', 'various_effects:create_heart_beat', status_name='heartbeat',
+         description='Heart beat pulsing between two colours')
+register('wave', 'various_effects:create_expanding_waves', status_name='expanding_waves',
+         description='Waves expanding out from the centre')
+register('flame', 'various_effects:create_flame',
+         description='Flickering flame')
+register('self_test', 'various_effects:create_self_test',
+         params=(effect_param('wait_ms', non_negative, None, 'time per pixel (milliseconds)'),),
+         description='Wipes yellow then black across the strip once, run at start-up')
+register('replay', 'recorder:create_player',
+         params=(effect_param('file', str, None, 'name of the recording', required=True),
+                 effect_param('loop', flag, True, 'start again at the end'),
+                 effect_param('seek', non_negative, 0.0, 'position to start from (seconds)')),
+         check='recorder:check_player_params',
+         description='Replays a recording of the strip (see /api/recording)')
+register('audio_loudness', 'audio_effects:create_loudness_effect', params=AUDIO_GAIN,
+         description='Bar following the loudness of the microphone')
+register('audio_frequency', 'audio_effects:create_frequency_effect', params=AUDIO_GAIN,
+         description='Spectrum of the microphone, one frequency band per LED')
+register('audio_frequency_stft', 'audio_effects:create_stft_frequency_effect',
+         params=(effect_param('window', int, None, 'analysis window (samples)'),
+                 effect_param('hop', int, None, 'samples between analyses')) + AUDIO_GAIN,
+         check='audio_effects:check_stft_params',
+         description='Spectrum analysed every hop samples over overlapping windows')
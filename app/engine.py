@@ -0,0 +1,302 @@
+"""
+Effect engine in a separate process.
+
+Normally the web server and the effects share one interpreter, so a burst of
+requests or a JSON-heavy status poll competes with the frame loop for the
+GIL and shows up as stutter. With serve.py --engine-process the strip, the
+output owner (commands.py) and the effects run in a child process instead,
+on a core of their own on a multi-core Pi, and the web process only talks
+to it:
+
+- Commands are sent over a multiprocessing pipe, and a command's result (or
+  its error) comes back once the engine has run it. Requests the engine
+  answers straight away, without going through the output owner (its
+  status, starting and stopping a recording), are calls of the functions
+  main.ENGINE_CALLS lists.
+- The frames transmitted to the strip (framebuffer.last_sent) and the timing
+  histograms of metrics.py live in one multiprocessing.shared_memory block
+  mapped by both processes, so /api/preview and /api/metrics read them in
+  place, without any copying or pickling.
+
+The shared block holds the hot_path histograms, the effect_switches
+histograms and then the last transmitted frame (one uint32 per pixel).
+"""
+
+import atexit
+import itertools
+import logging
+import os
+import signal
+import threading
+
+import numpy as np
+
+from commands import command, OUTPUT
+from framebuffer import framebuffer, get_framebuffer, PIXEL_DTYPE
+from metrics import hot_path, effect_switches
+
+
+log = logging.getLogger('led_controller')
+
+# Set to 1 (serve.py --engine-process) for main.py to run the effects in an
+# engine process rather than drive the strip itself
+ENGINE_ENV = 'LED_ENGINE_PROCESS'
+
+CALL_TIMEOUT = 2.0  # seconds to wait for the engine to answer a call
+
+
+def engine_process_enabled():
+    """Return True if main.py should run the effects in an engine process."""
+    return os.environ.get(ENGINE_ENV) == '1'
+
+
+def shared_size(num_pixels):
+    """Return the size in bytes of the shared block for a strip of num_pixels."""
+    return hot_path.nbytes + effect_switches.nbytes + num_pixels * np.dtype(PIXEL_DTYPE).itemsize
+
+
+def attach_shared(buffer, frame):
+    """Keep the metrics and the frame's last transmitted pixels in buffer.
+
+    Args:
+        buffer: the shared memory block (shared_size() bytes)
+        frame: framebuffer of the strip (or of its stand-in)
+    """
+    offset = hot_path.attach(buffer)
+    offset = effect_switches.attach(buffer, offset)
+    frame.last_sent = np.ndarray(frame.numPixels(), PIXEL_DTYPE, buffer, offset)
+
+
+class engine_strip():
+    """Stand-in for the strip in the web process.
+
+    Has the strip's size and a framebuffer whose last_sent shows the frames
+    the engine transmits. Nothing is ever shown through it.
+    """
+    def __init__(self, num_pixels):
+        self.framebuffer = framebuffer(None, num_pixels)
+
+    def numPixels(self):
+        """Return the number of pixels of the strip."""
+        return self.framebuffer.numPixels()
+
+
+class engine_client():
+    """Web-process end of the engine; submits commands like output_owner."""
+    def __init__(self, strip):
+        """
+        Args:
+            strip: engine_strip of the strip the engine drives
+        """
+        self.strip = strip
+        self.ids = itertools.count(1)
+        self.request_ids = itertools.count(1)
+        self.process = None
+        self.conn = None
+        self.shm = None
+        self.reader = None
+        self.send_lock = threading.Lock()
+
+        self.pending = {}  # command id -> command waiting for its result
+        self.replies = {}  # request id -> [threading.Event, result, error]
+
+    def start(self):
+        """Start the engine process if it is not running yet."""
+        if self.process is not None:
+            return
+
+        # multiprocessing is only loaded when the engine process is used
+        import multiprocessing
+        from multiprocessing import shared_memory
+
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=shared_size(self.strip.numPixels()))
+        attach_shared(self.shm.buf, self.strip.framebuffer)
+
+        # spawn rather than fork: the web process already runs threads
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=engine_main, name='led_engine', daemon=True,
+                                       args=(child_conn, self.shm.name,
+                                             logging.getLogger().level))
+        self.process.start()
+        child_conn.close()
+
+        self.reader = threading.Thread(target=self.read_replies, name='engine_replies',
+                                       daemon=True)
+        self.reader.start()
+
+        # Registered after importing multiprocessing, so at exit this runs
+        # before multiprocessing's own handler, which would only terminate
+        # the engine (which ignores SIGTERM) and wait for it forever
+        atexit.register(self.stop)
+        log.info('engine process started', extra={'pid': self.process.pid})
+
+    def stop(self, timeout=5.0):
+        """Have the engine turn the LEDs off and exit."""
+        if self.process is None:
+            return
+
+        try:
+            self.send(('stop',))
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            # the engine ignores SIGTERM, so a wedged one has to be killed
+            log.warning('engine process did not stop cleanly, killing it')
+            self.process.kill()
+            self.process.join(timeout)
+        self.reader.join(timeout)
+        self.conn.close()
+
+        # the metrics and preview keep their views of the block until this
+        # process exits, so it is unlinked here but not closed
+        self.shm.unlink()
+        self.process = None
+        log.info('engine process stopped')
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+    def submit(self, name, params=None, key=OUTPUT):
+        """Send a command to the engine and return it without waiting for it to run."""
+        self.start()
+        cmd = command(next(self.ids), name, params or {}, key)
+        self.pending[cmd.id] = cmd
+        try:
+            self.send(('command', cmd.id, name, cmd.params, key))
+        except OSError as e:
+            self.pending.pop(cmd.id, None)
+            cmd.error = f'Engine process unavailable: {e}'
+            cmd.done.set()
+        return cmd
+
+    def call(self, name, *args, timeout=CALL_TIMEOUT):
+        """Run main.<name>(*args) in the engine and return its result.
+
+        Args:
+            name: one of main.ENGINE_CALLS
+
+        Raises:
+            ValueError: if the function raised ValueError in the engine
+            RuntimeError: if the engine is not running or does not answer
+        """
+        if self.process is None:
+            raise RuntimeError('Engine process not running')
+
+        request_id = next(self.request_ids)
+        reply = [threading.Event(), None, None]
+        self.replies[request_id] = reply
+        try:
+            self.send(('call', request_id, name, args))
+            if not reply[0].wait(timeout):
+                raise RuntimeError(f'Engine process did not answer {name}')
+        except OSError as e:
+            raise RuntimeError(f'Engine process unavailable: {e}')
+        finally:
+            self.replies.pop(request_id, None)
+
+        if reply[2] is not None:
+            raise ValueError(reply[2])
+        return reply[1]
+
+    def status(self):
+        """Return the engine's main.engine_status(), or None if it does not answer."""
+        try:
+            return self.call('engine_status')
+        except RuntimeError:
+            return None
+
+    def read_replies(self):
+        """Complete commands and calls as the engine answers them."""
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == 'done':
+                _, command_id, result, error, superseded_by = message
+                cmd = self.pending.pop(command_id, None)
+                if cmd is not None:
+                    cmd.result = result
+                    cmd.error = error
+                    cmd.superseded_by = superseded_by
+                    cmd.done.set()
+            elif message[0] == 'reply':
+                _, request_id, result, error = message
+                reply = self.replies.get(request_id)
+                if reply is not None:
+                    reply[1] = result
+                    reply[2] = error
+                    reply[0].set()
+
+        # the engine has gone, fail whatever it had not finished
+        for command_id in list(self.pending):
+            cmd = self.pending.pop(command_id, None)
+            if cmd is not None:
+                cmd.error = 'Engine process exited'
+                cmd.done.set()
+
+
+def engine_main(conn, shm_name, log_level=logging.INFO):
+    """Entry point of the engine process: drive the strip and run the commands from conn.
+
+    Args:
+        conn: end of the pipe to the web process
+        shm_name: name of the shared memory block created by engine_client
+        log_level: level of the web process's logging
+    """
+    # The web process decides when the engine stops (and the LEDs go off)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from multiprocessing import shared_memory
+    from serve import configure_logging
+    configure_logging(log_level)
+
+    os.environ[ENGINE_ENV] = '0'  # this process drives the strip itself
+    import main as controller
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    attach_shared(shm.buf, get_framebuffer(controller.strip))
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except OSError:
+                pass  # the web process has gone
+
+    controller.outputs.on_done = lambda cmd: send(
+        ('done', cmd.id, cmd.result, cmd.error, cmd.superseded_by))
+    controller.startup()
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == 'command':
+                _, command_id, name, params, key = message
+                controller.outputs.submit(name, params, key, command_id=command_id)
+            elif message[0] == 'call':
+                _, request_id, name, args = message
+                result, error = None, None
+                try:
+                    if name not in controller.ENGINE_CALLS:
+                        raise ValueError(f'Not an engine call: {name}')
+                    result = getattr(controller, name)(*args)
+                except ValueError as e:
+                    error = str(e)
+                send(('reply', request_id, result, error))
+            elif message[0] == 'stop':
+                break
+    finally:
+        controller.cleanup()
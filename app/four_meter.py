@@ -9,3 +9,11 @@ LED_CHANNEL    = 0       # set to '1' for GPIOs 13, 19, 41, 45 or 53
 
 
 
+
+# Optional second strip on the other PWM channel, driven together with the one
+# above as a single logical strip (pixels LED_COUNT onwards). 0 disables it.
+LED_2_COUNT      = 0
+LED_2_PIN        = 13
+LED_2_BRIGHTNESS = 250
+LED_2_INVERT     = False
+LED_2_CHANNEL    = 1
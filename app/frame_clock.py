@@ -0,0 +1,145 @@
+"""
+Frame clock shared by all LED effects.
+
+Instead of sleeping a fixed time after each frame (so the real period is
+render time + show time + sleep and drifts with CPU load), effects run against
+absolute per-frame deadlines. Render cost is absorbed into the frame period and
+frames that miss their deadline are counted and handled by policy:
+
+- SKIP_FRAMES: jump to the next deadline still in the future, dropping the
+  frames that were missed (keeps the animation in step with wall time).
+- CATCH_UP: render the missed frames back to back until the clock is back on
+  schedule, dropping only what exceeds max_catch_up frames of backlog.
+
+Waiting for a deadline is done on the effect's stop event, so stopping an
+effect wakes it straight away instead of after the rest of its frame period.
+
+Effects expose step() (render one frame into self.frame), self.frame and
+self.frame_period, and are driven by run_effect(), which also times the
+render and sleep stages of every frame (see metrics.py).
+"""
+
+import time
+
+from metrics import hot_path, RENDER, SLEEP
+
+
+SKIP_FRAMES = 'skip'
+CATCH_UP = 'catch_up'
+
+
+class frame_clock():
+    """Deadline based frame scheduler with late/dropped frame accounting."""
+    def __init__(self, frame_period, policy=SKIP_FRAMES, max_catch_up=3):
+        """
+        Args:
+            frame_period: target time between frames in seconds
+            policy: SKIP_FRAMES or CATCH_UP
+            max_catch_up: most frames rendered back to back under CATCH_UP
+        """
+        if policy not in (SKIP_FRAMES, CATCH_UP):
+            raise ValueError(f"Unknown frame policy: {policy}")
+
+        self.frame_period = frame_period
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+
+        self.start_time = None
+        self.next_deadline = None
+        self.frames = 0
+        self.late_frames = 0
+        self.dropped_frames = 0
+
+    def start(self, now=None):
+        """(Re)start the clock with the first deadline one period from now."""
+        if now is None:
+            now = time.monotonic()
+        self.start_time = now
+        self.next_deadline = now + self.frame_period
+        self.frames = 0
+        self.late_frames = 0
+        self.dropped_frames = 0
+
+    def wait(self, stop_event=None):
+        """Finish the current frame: sleep until its deadline and schedule the next.
+
+        Args:
+            stop_event: threading.Event that cuts the sleep short when set
+
+        Returns:
+            The slack in seconds, negative if the frame was late.
+        """
+        now = time.monotonic()
+        if self.next_deadline is None:
+            self.start(now)
+
+        self.frames += 1
+        slack = self.next_deadline - now
+
+        if slack >= 0:
+            if stop_event is not None:
+                stop_event.wait(slack)
+            else:
+                time.sleep(slack)
+            self.next_deadline += self.frame_period
+            return slack
+
+        self.late_frames += 1
+        # whole frame periods that have already passed since the deadline
+        behind = int(-slack // self.frame_period) if self.frame_period > 0 else 0
+
+        if self.policy == SKIP_FRAMES:
+            self.dropped_frames += behind
+            self.next_deadline += (behind + 1) * self.frame_period
+        else:
+            excess = max(behind - self.max_catch_up, 0)
+            self.dropped_frames += excess
+            self.next_deadline += (excess + 1) * self.frame_period
+
+        return slack
+
+    def fps(self):
+        """Return the achieved frame rate since the clock started."""
+        if self.start_time is None or self.frames == 0:
+            return 0.0
+        elapsed = time.monotonic() - self.start_time
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        """Return the clock counters as a dictionary."""
+        return {
+            'target_fps': 1.0 / self.frame_period if self.frame_period > 0 else None,
+            'fps': round(self.fps(), 2),
+            'frames': self.frames,
+            'late_frames': self.late_frames,
+            'dropped_frames': self.dropped_frames,
+        }
+
+
+def run_effect(effect, stop_event=None, policy=SKIP_FRAMES, until=None):
+    """Render and show an effect's frames on its frame clock until stop_event is set.
+
+    Args:
+        effect: object with step(), frame and frame_period
+        stop_event: threading.Event that signals when to stop the effect
+        policy: SKIP_FRAMES or CATCH_UP
+        until: optional function, the effect also stops once it returns True
+    """
+    clock = frame_clock(effect.frame_period, policy)
+    effect.clock = clock
+
+    perf_counter = time.perf_counter
+    record = hot_path.record
+
+    while not (stop_event and stop_event.is_set()):
+        if until is not None and until():
+            break
+        start = perf_counter()
+        effect.step()
+        record(RENDER, perf_counter() - start)
+        effect.frame.show()
+        start = perf_counter()
+        clock.wait(stop_event)
+        record(SLEEP, perf_counter() - start)
+
+    return clock
@@ -0,0 +1,196 @@
+"""
+Framebuffer for LED effects.
+
+Effects render a whole frame into a contiguous NumPy array of packed colours
+(the same 0xWWRRGGBB layout that rpi_ws281x's Color() produces) using
+vectorized operations, then push it to the strip in one bulk copy per frame
+instead of one setPixelColor() call per LED.
+
+Usage:
+    frame = get_framebuffer(strip)
+    frame.fill(BACKCOLOUR)
+    frame.pixels[:40] = OUTER_FLAME_COLOUR
+    frame.show()
+"""
+
+import ctypes
+import time
+
+import numpy as np
+
+from metrics import hot_path, UPLOAD, SHOW
+
+
+PIXEL_DTYPE = np.uint32
+
+# Seconds after which an unchanged frame is transmitted again anyway, so the
+# strip recovers from glitches or power blips. None disables the refresh.
+KEEPALIVE_INTERVAL = 1.0
+
+
+def pack_colours(red, green, blue, white=0):
+    """Pack colour channels (scalars or arrays) into 0xWWRRGGBB uint32 values."""
+    red = np.asarray(red, dtype=PIXEL_DTYPE)
+    green = np.asarray(green, dtype=PIXEL_DTYPE)
+    blue = np.asarray(blue, dtype=PIXEL_DTYPE)
+    white = np.asarray(white, dtype=PIXEL_DTYPE)
+    return (white << 24) | (red << 16) | (green << 8) | blue
+
+
+def unpack_rgb(pixels):
+    """Return an (N, 3) uint8 array of the red, green and blue channels."""
+    # On a little-endian machine each uint32 is laid out in memory as B, G, R, W
+    channels = np.ascontiguousarray(pixels, dtype='<u4').view(np.uint8).reshape(-1, 4)
+    return channels[:, 2::-1]
+
+
+def led_buffer(strip):
+    """Return a writable uint32 NumPy view onto the strip's LED buffer, or None.
+
+    Strips may provide their own buffer through a led_buffer() method. For an
+    rpi_ws281x PixelStrip the C channel buffer is mapped directly, which only
+    exists once strip.begin() has been called.
+    """
+    own_buffer = getattr(strip, 'led_buffer', None)
+    if own_buffer is not None:
+        return own_buffer()
+
+    channel = getattr(strip, '_channel', None)
+    if channel is None:
+        return None
+    return channel_buffer(channel, strip.numPixels())
+
+
+def channel_buffer(channel, num_pixels):
+    """Return a uint32 NumPy view onto an rpi_ws281x channel's LED buffer, or None."""
+    try:
+        import _rpi_ws281x as ws
+        address = int(ws.ws2811_channel_t_leds_get(channel))
+    except (ImportError, TypeError, ValueError):
+        return None
+    if not address:
+        return None
+
+    c_buffer = (ctypes.c_uint32 * num_pixels).from_address(address)
+    return np.ctypeslib.as_array(c_buffer)
+
+
+def led_segments(strip):
+    """Return [(first pixel, LED buffer), ...] covering the strip, or None.
+
+    Strips made of several physical outputs provide one buffer per output
+    through a led_segments() method; anything else is a single segment.
+    """
+    own_segments = getattr(strip, 'led_segments', None)
+    if own_segments is not None:
+        return own_segments()
+
+    buffer = led_buffer(strip)
+    return None if buffer is None else [(0, buffer)]
+
+
+class framebuffer():
+    """A frame of packed colours for one strip.
+
+    Effects write into self.pixels (a uint32 array, one entry per LED) and call
+    show() once per frame to copy the whole frame to the strip and transmit it.
+    A frame identical to the last one transmitted is not sent again until
+    keepalive_interval has passed.
+    """
+    def __init__(self, strip, num_pixels=None, keepalive_interval=KEEPALIVE_INTERVAL):
+        self.strip = strip
+        if num_pixels is None:
+            num_pixels = strip.numPixels()
+        self.pixels = np.zeros(num_pixels, dtype=PIXEL_DTYPE)
+        self._segments = None
+
+        # Change detection against the last transmitted frame
+        self.keepalive_interval = keepalive_interval
+        self.last_sent = np.zeros(num_pixels, dtype=PIXEL_DTYPE)
+        self._changed = np.zeros(num_pixels, dtype=bool)
+        self.last_sent_time = None
+        self.shows_sent = 0
+        self.shows_skipped = 0
+
+        # recorder.show_recorder the transmitted frames are written to, if any
+        self.recorder = None
+
+    def numPixels(self):
+        """Return the number of pixels in the frame."""
+        return len(self.pixels)
+
+    def fill(self, color, start=0, stop=None):
+        """Set a range of pixels (default: all of them) to one colour."""
+        self.pixels[start:stop] = color
+
+    def upload(self):
+        """Copy the frame into the strip's LED buffer(s) in one bulk operation each."""
+        if self._segments is None:
+            self._segments = led_segments(self.strip)
+
+        if self._segments is not None:
+            for start, buffer in self._segments:
+                np.copyto(buffer, self.pixels[start:start + len(buffer)])
+        else:
+            # No direct buffer access (e.g. strip not started yet), fall back
+            # to the per-pixel interface.
+            for i, colour in enumerate(self.pixels.tolist()):
+                self.strip.setPixelColor(i, colour)
+
+    def changed(self):
+        """Return True if the frame differs from the last transmitted frame."""
+        np.not_equal(self.pixels, self.last_sent, out=self._changed)
+        return bool(self._changed.any())
+
+    def show(self, force=False):
+        """Upload the frame and transmit it to the LEDs.
+
+        The transmission is skipped when nothing has changed since the last
+        one, unless force is set or the keep-alive refresh is due.
+
+        Returns:
+            True if the frame was transmitted.
+        """
+        now = time.monotonic()
+        keepalive_due = (self.last_sent_time is None or
+                         (self.keepalive_interval is not None and
+                          now - self.last_sent_time >= self.keepalive_interval))
+
+        if not (force or keepalive_due or self.changed()):
+            self.shows_skipped += 1
+            return False
+
+        start = time.perf_counter()
+        self.upload()
+        uploaded = time.perf_counter()
+        self.strip.show()
+        hot_path.record(UPLOAD, uploaded - start)
+        hot_path.record(SHOW, time.perf_counter() - uploaded)
+        np.copyto(self.last_sent, self.pixels)
+        self.last_sent_time = now
+        self.shows_sent += 1
+
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write(self.pixels, now)
+        return True
+
+    def stats(self):
+        """Return the transmission counters as a dictionary."""
+        return {
+            'shows_sent': self.shows_sent,
+            'shows_skipped': self.shows_skipped,
+        }
+
+
+def get_framebuffer(strip):
+    """Return the framebuffer shared by all effects drawing on this strip.
+
+    Strips that already carry a framebuffer (for example virtual strips) keep
+    it; otherwise one is created and attached to the strip.
+    """
+    frame = getattr(strip, 'framebuffer', None)
+    if frame is None:
+        frame = framebuffer(strip)
+        strip.framebuffer = frame
+    return frame
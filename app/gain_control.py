@@ -0,0 +1,110 @@
+"""
+Automatic gain control for the audio effects.
+
+Instead of scaling against a fixed reference level (too dark in a quiet
+room, saturated at a loud gig), the audio effects divide their measurements
+by a running peak level that follows the input: it rises towards a louder
+value over the attack time and decays towards a quieter one over the
+release time.
+
+The level is tracked per band - one for the loudness effect, one per
+frequency band for the spectrum - and every update is a handful of
+whole-array operations on preallocated buffers, O(bands) with no history
+kept, however long the time constants.
+
+Usage:
+    agc = auto_gain(num_bands, attack=0.1, release=4.0, floor=5000)
+    ratios = agc.normalise(band_means)  # 0..1 per band
+"""
+
+import time
+
+import numpy as np
+
+
+class auto_gain():
+    """Running peak level per band, with attack and release times."""
+    def __init__(self, bands, attack, release, floor, headroom=1.0, band_range=None):
+        """
+        Args:
+            bands: number of values measured per update
+            attack: seconds to follow a louder level (time constant)
+            release: seconds to fall back after it gets quieter
+            floor: lowest reference level, so silence and background noise
+                   stay dark instead of being amplified to full scale
+            headroom: the reference is the tracked level times this, so
+                      peaks above the recent level still fit (ratio up to 1)
+            band_range: if set, no band's reference drops below the loudest
+                        band's divided by this, which keeps the balance
+                        between bands (None: every band scales on its own)
+
+        Raises:
+            ValueError: if attack or release is negative (0 follows at once)
+        """
+        if attack < 0 or release < 0:
+            raise ValueError(f'attack and release must not be negative ({attack}, {release})')
+        self.attack = attack
+        self.release = release
+        self.floor = floor
+        self.headroom = headroom
+        self.band_range = band_range
+
+        self.level = np.full(bands, float(floor))
+        self.last_update = None
+
+        # Preallocated per-update buffers
+        self.difference = np.zeros(bands)
+        self.coefficient = np.zeros(bands)
+        self.reference = np.zeros(bands)
+        self.ratio = np.zeros(bands)
+
+    def update(self, values, now=None):
+        """Move each band's level towards values (one per band).
+
+        Args:
+            values: measurements of this update, array of length bands
+            now: time.perf_counter() of the measurement (default: now)
+        """
+        if now is None:
+            now = time.perf_counter()
+        if self.last_update is None:
+            # first measurement: start from it rather than ramp up to it
+            np.maximum(values, self.floor, out=self.level)
+            self.last_update = now
+            return
+        elapsed = now - self.last_update
+        self.last_update = now
+
+        # One-pole smoothing: rising bands move by the attack coefficient,
+        # falling bands by the release coefficient
+        attack = 1.0 - np.exp(-elapsed / self.attack) if self.attack > 0 else 1.0
+        release = 1.0 - np.exp(-elapsed / self.release) if self.release > 0 else 1.0
+        np.subtract(values, self.level, out=self.difference)
+        np.copyto(self.coefficient, release)
+        np.copyto(self.coefficient, attack, where=self.difference > 0)
+        self.difference *= self.coefficient
+        self.level += self.difference
+        np.maximum(self.level, self.floor, out=self.level)
+
+    def normalise(self, values, now=None):
+        """Update the levels with values and return them scaled to 0..1.
+
+        The returned array is reused by the next call.
+        """
+        self.update(values, now)
+
+        reference = self.reference
+        np.multiply(self.level, self.headroom, out=reference)
+        if self.band_range is not None:
+            np.maximum(reference, reference.max() / self.band_range, out=reference)
+
+        np.divide(values, reference, out=self.ratio)
+        return np.clip(self.ratio, 0.0, 1.0, out=self.ratio)
+
+    def stats(self):
+        """Return the lowest, highest and mean tracked level."""
+        return {
+            'min_level': round(float(self.level.min()), 1),
+            'max_level': round(float(self.level.max()), 1),
+            'mean_level': round(float(self.level.mean()), 1),
+        }
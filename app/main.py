@@ -4,17 +4,41 @@ LED String Web Controller - Flask Application
 This Flask app controls LED effects using threading for continuous operation.
 
 Threading Architecture:
-- Effects run in background threads (daemon threads)
-- stop_event (threading.Event) signals when to stop an effect
-- Only one effect runs at a time
-- Starting a new effect automatically stops the current one
+- One output owner thread (commands.py) is the only thread that drives the
+  strip: it runs the queued commands in order and the current effect in
+  between; request handlers never touch the LEDs
+- Control requests are queued as commands; with ENQUEUE_COMMANDS set
+  (serve.py) the routes return as soon as the command is queued
+- Queuing a command interrupts the running effect (through its stop_event),
+  and superseded commands still waiting are coalesced so only the latest runs
+- Only one effect runs at a time; to show several at once, divide the strip
+  into zones (zones.py), whose effects share that one render loop
 
 API Endpoints:
 - GET  /                      - Home page
 - GET  /api/status            - Get current status and running effect
-- GET  /api/effects           - List available effects
+- GET  /api/metrics           - Per-stage frame timing histograms, fps and dropped frames
+                                (JSON, or Prometheus text with format=prometheus)
+- GET  /api/preview           - Server-Sent Events stream of the frames shown (param: fps);
+                                503 when preview_clients streams are already open
+- GET  /api/effects           - List available effects and their parameters (effect_registry.py)
+- GET  /api/zones             - Current zones and the effect in each
+- POST /api/zones             - Run effects on zones of the strip, e.g.
+                                {"zones": [{"name": "left", "start": 0, "stop": 100, "effect": "flame"},
+                                           {"name": "right", "start": 100, "stop": 260,
+                                            "effect": "audio_frequency"}], "fade": 1}
+- GET  /api/recording         - The recording in progress, if any, and the saved recordings
+- POST /api/recording         - Record the frames shown on the strip (recorder.py), e.g.
+                                {"name": "gig", "delta": true}; replay it with
+                                /control_led/replay?file=gig (optional loop= and seek=)
+- DELETE /api/recording       - Stop recording
+- POST /api/recording/seek    - Move the running replay to a time (param: seconds)
 - GET  /api/set_color         - Set all LEDs to a solid color (param: color=#RRGGBB)
+- POST /api/commands          - Run a JSON list of commands in order, e.g.
+                                [{"command": "flame", "fade": 1}, {"command": "stop"}]
 - GET  /control_led/<effect>  - Start an effect (heart, wave, flame, stop)
+                                (optional fade= crossfade seconds; audio_frequency_stft also
+                                 takes window= and hop= sample counts)
 
 Usage:
 - Visit http://your-pi-ip:5000/ to see the web interface
@@ -22,73 +46,365 @@ Usage:
 - Use /control_led/wave to start wave effect
 - Use /control_led/flame to start flame effect
 - Use /control_led/stop to stop all effects and turn off LEDs
+- Run serve.py instead of main.py for the production server (serve.py
+  --engine-process runs the effects in a separate process, see engine.py)
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from rpi_ws281x import *
-import threading
+import logging
 import sys
 
 import various_effects as ve
-import audio_effects as ae
+from framebuffer import get_framebuffer
+from metrics import hot_path, effect_switches, prometheus_text, process_age
+from preview import preview_events, client_limit, PREVIEW_FPS
+from compositor import crossfade
+from commands import output_owner, unique_key
+from multi_strip import multi_channel_strip, output_config
+from zones import zone_layout
+from engine import engine_client, engine_strip, engine_process_enabled
+from effect_registry import effects, get_effect, effect_names, loaded_module
+from recorder import show_recorder, recording_path, list_recordings
 
 
 from four_meter import LED_COUNT, LED_PIN, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL
+from four_meter import LED_2_COUNT, LED_2_PIN, LED_2_INVERT, LED_2_BRIGHTNESS, LED_2_CHANNEL
+
+log = logging.getLogger('led_controller')
 
 app = Flask(__name__)
 
 # Configuration
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this in production
+# Return from the control routes as soon as the command is queued (serve.py
+# sets this); otherwise wait for it to run and report the result
+app.config['ENQUEUE_COMMANDS'] = False
 
 background_color = Color(0,0,0)
 
-# Create NeoPixel object with appropriate configuration.
-strip = Adafruit_NeoPixel(LED_COUNT, LED_PIN, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL)
-strip.begin()
-
-# Thread control variables
-effect_thread = None
-stop_event = threading.Event()
+# Run the effects in a separate engine process (serve.py --engine-process)
+# that owns the strip; this process then only serves the web routes
+ENGINE_PROCESS = engine_process_enabled()
+
+# Create NeoPixel object with appropriate configuration. With a second strip
+# configured both are driven as one logical strip, clocked out in parallel.
+if ENGINE_PROCESS:
+    strip = engine_strip(LED_COUNT + LED_2_COUNT)  # stand-in, the engine drives the LEDs
+elif LED_2_COUNT:
+    strip = multi_channel_strip([
+        output_config(LED_COUNT, LED_PIN, LED_CHANNEL, LED_INVERT, LED_BRIGHTNESS),
+        output_config(LED_2_COUNT, LED_2_PIN, LED_2_CHANNEL, LED_2_INVERT, LED_2_BRIGHTNESS),
+    ], LED_FREQ_HZ, LED_DMA)
+    strip.begin()
+else:
+    strip = Adafruit_NeoPixel(LED_COUNT, LED_PIN, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL)
+    strip.begin()
+
+# The effect the output owner is running
 current_effect = None
-thread_lock = threading.Lock()
+current_effect_object = None  # effect instance (the incoming one during a crossfade)
+
+# Open /api/preview streams; each holds a request thread (serve.py sets the limit)
+preview_clients = client_limit()
 
+# Seconds from process start until startup() had queued the self-test and
+# until the first request was served
+startup_times = {'ready': None, 'first_request': None}
 
 
 def stop_current_effect():
-    """Stop the currently running effect thread."""
-    global effect_thread, stop_event, current_effect
-    
-    with thread_lock:
-        if effect_thread and effect_thread.is_alive():
-            stop_event.set()
-            effect_thread.join(timeout=2.0)  # Wait up to 2 seconds for thread to finish
-            if effect_thread.is_alive():
-                print(f"Warning: Effect thread did not stop cleanly")
-        
-        effect_thread = None
-        current_effect = None
-        stop_event.clear()
-
-
-def start_effect(effect_name, effect_function, *args, **kwargs):
-    """Start a new effect in a background thread."""
-    global effect_thread, current_effect
-    
-    print(f"start_effect called: {effect_name}")
-    
-    # Stop any currently running effect
-    stop_current_effect()
-    
-    with thread_lock:
-        current_effect = effect_name
-        effect_thread = threading.Thread(
-            target=effect_function,
-            args=args,
-            kwargs=kwargs,
-            daemon=True
-        )
-        effect_thread.start()
-        print(f"Thread started for {effect_name}, thread alive: {effect_thread.is_alive()}")
+    """Stop the current effect; called on the output owner thread."""
+    global current_effect, current_effect_object
+
+    outputs.set_effect(None)
+    current_effect = None
+    current_effect_object = None
+
+
+def start_effect(effect_name, effect, fade_seconds=0):
+    """Make effect the one the output owner runs; called on its thread.
+
+    Args:
+        effect_name: name reported by /api/status
+        effect: effect object with run(stop_event)
+        fade_seconds: crossfade from the current effect over this time
+    """
+    global current_effect, current_effect_object
+
+    # nothing to fade from if the last effect finished (or failed)
+    outgoing = current_effect_object if outputs.effect is not None else None
+    if fade_seconds > 0 and outgoing is not None:
+        outputs.set_effect(crossfade(outgoing, effect, fade_seconds))
+    else:
+        outputs.set_effect(effect)
+
+    current_effect = effect_name
+    current_effect_object = effect
+    log.info('effect started', extra={'effect': effect_name})
+
+
+def frame_stats():
+    """Return the frame clock counters of the running effect, if any."""
+    clock = getattr(current_effect_object, 'clock', None)
+    return clock.stats() if clock else None
+
+
+def audio_stats():
+    """Return the audio capture counters of the running effect, if any."""
+    stats = getattr(current_effect_object, 'audio_stats', None)
+    return stats() if stats else None
+
+
+def output_info():
+    """Return the physical outputs and the logical pixels each one shows."""
+    info = getattr(strip, 'output_info', None)
+    if info is not None:
+        return info()
+    return [{'pin': LED_PIN, 'channel': LED_CHANNEL, 'first_pixel': 0, 'count': LED_COUNT}]
+
+
+def zone_info():
+    """Return the zones of the running layout, or None when not running zones."""
+    info = getattr(current_effect_object, 'zone_info', None)
+    return info() if info else None
+
+
+def switch_stats():
+    """Return the last and p99 effect stop/switch times in milliseconds."""
+    return {
+        'last_stop_ms': outputs.last_stop_ms,
+        'last_switch_ms': outputs.last_switch_ms,
+        'stop_p99_ms': effect_switches.stats()['stop']['p99_ms'],
+        'switch_p99_ms': effect_switches.stats()['switch']['p99_ms'],
+    }
+
+
+def engine_status():
+    """Return the state of the effects and the output reported by /api/status.
+
+    Returns None if the engine process does not answer.
+    """
+    if ENGINE_PROCESS:
+        return outputs.status()
+
+    return {
+        # effects that finish by themselves (the self-test) leave no effect running
+        'current_effect': current_effect if outputs.effect is not None else None,
+        'effect_running': outputs.effect is not None,
+        'frame_stats': frame_stats(),
+        'zones': zone_info(),
+        'outputs': output_info(),
+        'output_stats': get_framebuffer(strip).stats(),
+        'audio_stats': audio_stats(),
+        'switch_stats': switch_stats(),
+        'command_stats': outputs.stats()
+    }
+
+
+def recording_status():
+    """Return the recording in progress (None if not recording) and the saved recordings."""
+    if ENGINE_PROCESS:
+        return outputs.call('recording_status')
+
+    recorder = get_framebuffer(strip).recorder
+    return {
+        'recording': recorder.stats() if recorder is not None else None,
+        'recordings': list_recordings()
+    }
+
+
+def start_recording(name, delta=True):
+    """Record every frame transmitted to the strip to the named recording.
+
+    Args:
+        name: recording name (a file in recorder.RECORDINGS_DIR)
+        delta: store the frames between keyframes as deltas
+
+    Returns:
+        recording_status()
+
+    Raises:
+        ValueError: if already recording, or the name is invalid or taken
+        RuntimeError: if the engine process does not answer
+    """
+    if ENGINE_PROCESS:
+        return outputs.call('start_recording', name, delta)
+
+    frame = get_framebuffer(strip)
+    if frame.recorder is not None:
+        raise ValueError('Already recording')
+    try:
+        frame.recorder = show_recorder(recording_path(name), frame.numPixels(), delta)
+    except FileExistsError:
+        raise ValueError(f'Recording {name} already exists')
+    log.info('recording started', extra={'recording': name, 'delta': delta})
+    return recording_status()
+
+
+def stop_recording():
+    """Stop recording, if recording; returns recording_status() with the stopped recording."""
+    if ENGINE_PROCESS:
+        return outputs.call('stop_recording')
+
+    frame = get_framebuffer(strip)
+    recorder = frame.recorder
+    if recorder is None:
+        return recording_status()
+    frame.recorder = None
+    recorder.close()
+    log.info('recording stopped', extra={'recording': recorder.stats()})
+    return {**recording_status(), 'recording': recorder.stats()}
+
+
+def seek_replay(seconds):
+    """Move the running replay effect to seconds into its recording.
+
+    Raises:
+        ValueError: if no replay is running
+    """
+    if ENGINE_PROCESS:
+        return outputs.call('seek_replay', seconds)
+
+    player = current_effect_object
+    if outputs.effect is None or not hasattr(player, 'seek'):
+        raise ValueError('No replay is running')
+    player.seek(seconds)
+    return {'effect': current_effect, 'seek': seconds}
+
+
+# Functions the web process may run in the engine process (engine_client.call)
+ENGINE_CALLS = ('engine_status', 'recording_status', 'start_recording', 'stop_recording',
+                'seek_replay')
+
+
+def engine_unavailable():
+    return jsonify({
+        'status': 'error',
+        'message': 'The effect engine is not responding'
+    }), 503
+
+
+def parse_command(name, params):
+    """Check a command and convert its parameters.
+
+    Args:
+        name: a registered effect, 'zones', 'stop' or 'set_color'
+        params: mapping of parameter names to values (strings from a query
+                string or values from JSON)
+
+    Returns:
+        Dictionary of the converted parameters.
+
+    Raises:
+        ValueError: if the command or a parameter is invalid
+    """
+    if name == 'set_color':
+        color_hex = str(params.get('color', '#000000')).lstrip('#')
+        if len(color_hex) != 6:
+            raise ValueError(f"Invalid color: {params.get('color')}")
+        return {
+            'color': f'#{color_hex}',
+            'rgb': {'r': int(color_hex[0:2], 16),
+                    'g': int(color_hex[2:4], 16),
+                    'b': int(color_hex[4:6], 16)}
+        }
+    if name == 'stop':
+        return {}
+    if name == 'zones':
+        return parse_zones(params)
+    return get_effect(name).parse(params)
+
+
+def parse_zones(params):
+    """Check the zones of a 'zones' command, see parse_command().
+
+    params['zones'] is a list of {"name", "start", "stop", "effect"} objects,
+    plus any parameters of the effect; params['fade'] crossfades to the zones.
+    The fade is for the whole layout, so a zone with its own "fade" is refused.
+    """
+    specs = params.get('zones')
+    if not isinstance(specs, list) or not specs:
+        raise ValueError('Expected a list of zones')
+
+    # lay the zones out on a scratch layout to check their ranges
+    layout = zone_layout(get_framebuffer(strip))
+    zones = []
+    for spec in specs:
+        spec = dict(spec)
+        zone_name = str(spec.pop('name', f'zone{len(zones)}'))
+        effect_name = spec.pop('effect', None)
+        if 'start' not in spec or 'stop' not in spec:
+            raise ValueError(f'Zone {zone_name} needs a start and a stop pixel')
+        start, stop = int(spec.pop('start')), int(spec.pop('stop'))
+        if 'fade' in spec:
+            raise ValueError(f'Zone {zone_name} has a fade; set fade for all the zones, '
+                             f'next to "zones"')
+        layout.add_zone(zone_name, start, stop)
+        if effect_name not in effects:
+            raise ValueError(f'Unknown effect in zone {zone_name}: {effect_name}')
+        zones.append({'name': zone_name, 'start': start, 'stop': stop,
+                      'effect': effect_name, 'params': effects[effect_name].parse(spec)})
+
+    return {'fade': float(params.get('fade', 0.0)), 'zones': zones}
+
+
+def run_command(name, params):
+    """Run one command from parse_command(); called on the command worker thread.
+
+    Returns:
+        Dictionary describing the outcome.
+    """
+    fade = params.get('fade', 0.0)
+
+    match name:
+        case _ if name in effects:
+            log.info('starting effect', extra={'effect': name})
+            effect_name, effect = effects[name].create(strip, params)
+            start_effect(effect_name, effect, fade_seconds=fade)
+        case 'zones':
+            log.info('starting zones', extra={'zones': params['zones']})
+            # every zone's effect draws into its part of the one frame and
+            # the layout shows it once per frame
+            layout = zone_layout(get_framebuffer(strip))
+            for spec in params['zones']:
+                zone = layout.add_zone(spec['name'], spec['start'], spec['stop'])
+                layout.set_effect(zone, *effects[spec['effect']].create(zone, spec['params']))
+            start_effect('zones', layout, fade_seconds=fade)
+            return {
+                'effect': current_effect,
+                'zones': layout.zone_info()
+            }
+        case "stop":
+            log.info('stopping all effects')
+            stop_current_effect()
+            ve.set_all(strip, Color(0, 0, 0))  # Turn off all LEDs
+            return {
+                'action': 'stopped',
+                'effect': 'none'
+            }
+        case "set_color":
+            # Stop any running effects first
+            stop_current_effect()
+            rgb = params['rgb']
+            ve.set_all(strip, Color(rgb['r'], rgb['g'], rgb['b']))
+            return {
+                'color': params['color'],
+                'rgb': rgb
+            }
+        case _:
+            raise ValueError(f'Unknown command: {name}')
+
+    return {'effect': current_effect}
+
+
+# Commands from the routes are run in order on the one thread that drives
+# the strip, which runs the current effect in between (in the engine process,
+# if there is one)
+if ENGINE_PROCESS:
+    outputs = engine_client(strip)
+else:
+    outputs = output_owner(run_command)
 
 
 @app.route('/')
@@ -100,14 +416,58 @@ def index():
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """API endpoint to get current status"""
+    status = engine_status()
+    if status is None:
+        return engine_unavailable()
+
     return jsonify({
         'status': 'ok',
         'message': 'Flask app is running',
-        'current_effect': current_effect,
-        'effect_running': effect_thread.is_alive() if effect_thread else False
+        **status,
+        'startup': startup_times
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """API endpoint for the hot path timing metrics"""
+    status = engine_status()
+    if status is None:
+        return engine_unavailable()
+
+    if request.args.get('format') == 'prometheus':
+        text = prometheus_text([hot_path, effect_switches], status['current_effect'],
+                               status['frame_stats'], status['output_stats'], startup_times)
+        return Response(text, mimetype='text/plain; version=0.0.4')
+
+    return jsonify({
+        'status': 'ok',
+        'current_effect': status['current_effect'],
+        'frame_stats': status['frame_stats'],
+        'output_stats': status['output_stats'],
+        'stages': hot_path.stats(),
+        'switches': effect_switches.stats(),
+        'startup': startup_times
     })
 
 
+@app.route('/api/preview', methods=['GET'])
+def preview_stream():
+    """API endpoint streaming a live preview of the strip (Server-Sent Events)"""
+    if not preview_clients.acquire():
+        return jsonify({
+            'status': 'error',
+            'message': f'Too many preview clients (at most {preview_clients.limit})'
+        }), 503
+
+    fps = request.args.get('fps', PREVIEW_FPS, type=int)
+    response = Response(preview_events(get_framebuffer(strip), fps),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+    response.call_on_close(preview_clients.release)
+    return response
+
+
 @app.route('/api/data', methods=['POST'])
 def post_data():
     """API endpoint to receive data"""
@@ -123,64 +483,80 @@ def post_data():
 def control_led(led_id):
     """API endpoint to control a specific LED"""
     data = request.args
-    print(f"Received request for effect: {led_id}")
-    
-    # Control the LED here using the data
-
-    match led_id:
-        case 'heart':
-            print("Starting heartbeat effect...")
-            start_effect(
-                'heartbeat',
-                ve.heart_beat,
-                strip,
-                ve.NEGATIVE_BEAT_COLOUR,
-                ve.POSITIVE_BEAT_COLOUR,
-                stop_event
-            )
-        case "wave":
-            print("Starting wave effect...")
-            ex_wave = ve.expanding_waves(strip, 0.5, 
-                                         ve.BACKCOLOUR, 
-                                         ve.OUTER_FLAME_COLOUR)
-            start_effect('expanding_waves', ex_wave.run, stop_event)
-        case "flame":
-            print("Starting flame effect...")
-            flame_effect = ve.flame(strip, ve.BACKCOLOUR, 
-                                    ve.OUTER_FLAME_COLOUR, 
-                                    ve.INNER_FLAME_COLOUR)
-            start_effect('flame', flame_effect.run, stop_event)
-        case "audio_loudness":
-            print("Starting audio loudness effect...")
-            ae.clear_audio_buffer()  # Clear any pending audio data
-            loudness_controller = ae.create_loudness_controller(strip)
-            start_effect('audio_loudness', loudness_controller.run, stop_event)
-        case "audio_frequency":
-            print("Starting audio frequency effect...")
-            ae.clear_audio_buffer()  # Clear any pending audio data
-            frequency_controller = ae.create_frequency_controller(strip)
-            start_effect('audio_frequency', frequency_controller.run, stop_event)
-        case "stop":
-            print("Stopping all effects...")
-            stop_current_effect()
-            ve.set_all(strip, Color(0, 0, 0))  # Turn off all LEDs
-            return jsonify({
-                'status': 'success',
-                'action': 'stopped',
-                'effect': 'none'
-            })
-        case _:
-            print(f"Unknown effect: {led_id}")
-            return jsonify({
-                'status': 'error',
-                'message': f'Unknown effect: {led_id}'
-            }), 400
+    log.info('effect requested', extra={'effect': led_id})
+
+    try:
+        params = parse_command(led_id, data)
+    except ValueError as e:
+        log.warning('invalid command', extra={'effect': led_id, 'error': str(e)})
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    cmd = outputs.submit(led_id, params)
+    if app.config['ENQUEUE_COMMANDS']:
+        return jsonify({
+            'status': 'queued',
+            'command_id': cmd.id,
+            'led_id': led_id
+        }), 202
+
+    cmd.wait()
+    if cmd.error:
+        return jsonify({'status': 'error', 'message': cmd.error}), 500
 
     return jsonify({
         'status': 'success',
         'led_id': led_id,
         'action': data.get('action'),
-        'effect': current_effect
+        **cmd.result
+    })
+
+
+@app.route('/api/commands', methods=['POST'])
+def post_commands():
+    """API endpoint to run several commands in order.
+
+    Takes a JSON list (or {"commands": [...]}) of objects naming the command
+    and its parameters, e.g. [{"command": "flame", "fade": 1},
+    {"command": "set_color", "color": "#ff8800"}]. Nothing is queued unless
+    every command is valid. Every command of the list runs: they are not
+    coalesced with each other.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('commands')
+    if not isinstance(data, list):
+        return jsonify({
+            'status': 'error',
+            'message': 'Expected a JSON list of commands'
+        }), 400
+
+    try:
+        parsed = []
+        for entry in data:
+            params = dict(entry)
+            name = params.pop('command', None)
+            parsed.append((name, parse_command(name, params)))
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    submitted = [outputs.submit(name, params, key=unique_key()) for name, params in parsed]
+    if app.config['ENQUEUE_COMMANDS']:
+        return jsonify({
+            'status': 'queued',
+            'command_ids': [cmd.id for cmd in submitted]
+        }), 202
+
+    results = []
+    for cmd in submitted:
+        cmd.wait()
+        results.append({'command_id': cmd.id, 'command': cmd.name,
+                        'result': cmd.result, 'error': cmd.error})
+    return jsonify({
+        'status': 'success',
+        'results': results
     })
 
 
@@ -189,7 +565,134 @@ def list_effects():
     """API endpoint to list available effects"""
     return jsonify({
         'status': 'success',
-        'effects': ['heart', 'wave', 'flame', 'audio_loudness', 'audio_frequency', 'stop']
+        'effects': effect_names() + ['stop'],
+        'details': [spec.info() for spec in effects.values()]
+    })
+
+
+@app.route('/api/zones', methods=['GET'])
+def get_zones():
+    """API endpoint for the zones of the strip and their effects"""
+    status = engine_status()
+    if status is None:
+        return engine_unavailable()
+
+    return jsonify({
+        'status': 'success',
+        'zones': status['zones']
+    })
+
+
+@app.route('/api/zones', methods=['POST'])
+def set_zones():
+    """API endpoint to run an effect on each of several zones of the strip.
+
+    Takes {"zones": [{"name": ..., "start": ..., "stop": ..., "effect": ...}, ...],
+    "fade": seconds}; each zone covers pixels start to stop - 1 and may carry
+    its effect's parameters (e.g. window and hop). Zones must not overlap;
+    pixels outside every zone keep their colour.
+    """
+    data = request.get_json(silent=True)
+    try:
+        params = parse_command('zones', data if isinstance(data, dict) else {})
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    cmd = outputs.submit('zones', params)
+    if app.config['ENQUEUE_COMMANDS']:
+        return jsonify({
+            'status': 'queued',
+            'command_id': cmd.id
+        }), 202
+
+    cmd.wait()
+    if cmd.error:
+        return jsonify({'status': 'error', 'message': cmd.error}), 500
+
+    return jsonify({
+        'status': 'success',
+        **cmd.result
+    })
+
+
+@app.route('/api/recording', methods=['GET'])
+def get_recording():
+    """API endpoint for the recording in progress and the saved recordings"""
+    try:
+        status = recording_status()
+    except RuntimeError:
+        return engine_unavailable()
+
+    return jsonify({
+        'status': 'success',
+        **status
+    })
+
+
+@app.route('/api/recording', methods=['POST'])
+def post_recording():
+    """API endpoint to start recording the frames shown on the strip.
+
+    Takes {"name": ..., "delta": true}; the recording can then be replayed
+    with the replay effect.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('name'):
+        return jsonify({
+            'status': 'error',
+            'message': 'Expected {"name": ...}'
+        }), 400
+
+    try:
+        status = start_recording(str(data['name']), bool(data.get('delta', True)))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except RuntimeError:
+        return engine_unavailable()
+
+    return jsonify({
+        'status': 'success',
+        **status
+    })
+
+
+@app.route('/api/recording', methods=['DELETE'])
+def delete_recording():
+    """API endpoint to stop recording"""
+    try:
+        status = stop_recording()
+    except RuntimeError:
+        return engine_unavailable()
+
+    return jsonify({
+        'status': 'success',
+        **status
+    })
+
+
+@app.route('/api/recording/seek', methods=['POST'])
+def seek_recording():
+    """API endpoint to move the running replay to another time (param: seconds)"""
+    seconds = request.args.get('seconds', type=float)
+    if seconds is None or seconds < 0:
+        return jsonify({
+            'status': 'error',
+            'message': 'Expected seconds= (a time in the recording)'
+        }), 400
+
+    try:
+        result = seek_replay(seconds)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except RuntimeError:
+        return engine_unavailable()
+
+    return jsonify({
+        'status': 'success',
+        **result
     })
 
 
@@ -197,33 +700,32 @@ def list_effects():
 def set_color():
     """API endpoint to set all LEDs to a solid color"""
     color_hex = request.args.get('color', '#000000')
-    print(f"Setting solid color: {color_hex}")
-    
+    log.info('solid color requested', extra={'color': color_hex})
+
     try:
-        # Stop any running effects first
-        stop_current_effect()
-        
-        # Convert hex color to RGB
-        color_hex = color_hex.lstrip('#')
-        r = int(color_hex[0:2], 16)
-        g = int(color_hex[2:4], 16)
-        b = int(color_hex[4:6], 16)
-        
-        # Set all LEDs to the chosen color
-        color = Color(r, g, b)
-        ve.set_all(strip, color)
-        
-        return jsonify({
-            'status': 'success',
-            'color': f'#{color_hex}',
-            'rgb': {'r': r, 'g': g, 'b': b}
-        })
-    except Exception as e:
-        print(f"Error setting color: {e}")
+        params = parse_command('set_color', {'color': color_hex})
+    except ValueError as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
-        }), 500
+        }), 400
+
+    cmd = outputs.submit('set_color', params)
+    if app.config['ENQUEUE_COMMANDS']:
+        return jsonify({
+            'status': 'queued',
+            'command_id': cmd.id,
+            'color': params['color']
+        }), 202
+
+    cmd.wait()
+    if cmd.error:
+        return jsonify({'status': 'error', 'message': cmd.error}), 500
+
+    return jsonify({
+        'status': 'success',
+        **cmd.result
+    })
 
 
 @app.errorhandler(404)
@@ -238,12 +740,40 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 
+@app.after_request
+def record_first_request(response):
+    """Log the time from process start to the first request served."""
+    if startup_times['first_request'] is None:
+        startup_times['first_request'] = process_age()
+        log.info('first request served', extra={'seconds_since_start': startup_times['first_request']})
+    return response
+
+
+def startup():
+    """Start the output owner (or engine process) and queue the LED self-test.
+
+    The self-test (light the strip yellow, then turn it off) runs on the
+    output owner like any other effect, so the web server is up straight
+    away and the first command interrupts it.
+    """
+    outputs.start()
+    if not ENGINE_PROCESS:  # otherwise the engine process runs its own startup()
+        outputs.submit('self_test', parse_command('self_test', {}))
+
+    startup_times['ready'] = process_age()
+    log.info('ready', extra={'seconds_since_start': startup_times['ready']})
+
+
 def cleanup():
     """Cleanup function to stop effects and turn off LEDs when app exits."""
-    stop_current_effect()
-    ae.close_audio_stream()  # Close audio stream if it was opened
-    ve.set_all(strip, Color(0, 0, 0))
-    print("LED strip cleaned up and turned off")
+    outputs.stop()
+    if not ENGINE_PROCESS:  # otherwise the engine process has done this
+        stop_recording()
+        audio = loaded_module('audio_effects')  # only if an audio effect was used
+        if audio is not None:
+            audio.close_audio_stream()  # Close audio stream if it was opened
+        ve.set_all(strip, Color(0, 0, 0))
+        log.info("LED strip cleaned up and turned off")
 
 
 if __name__ == '__main__':
@@ -261,8 +791,8 @@ if __name__ == '__main__':
     
     signal.signal(signal.SIGINT, signal_handler)
 
-    ve.colorWipe(strip, Color(255, 255, 0), 10)  # Ensure LEDs are off at start
-    ve.colorWipe(strip, Color(0, 0, 0), 10)  # Ensure LEDs are off at start
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    startup()
     
     # Run Flask without the reloader in debug mode to avoid process complications
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
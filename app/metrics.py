@@ -0,0 +1,202 @@
+"""
+Always-on timing of the effect loop's hot path.
+
+Every stage of a frame is timed with time.perf_counter() and counted into a
+fixed latency histogram, so recording a sample is one bisect and two array
+increments (well under a microsecond) and nothing is allocated per frame:
+
+- AUDIO_READ: copying the latest window out of the audio ring buffer
+- ANALYSIS:   FFT / loudness analysis of that window
+- MAPPING:    turning the analysis into LED colours
+- RENDER:     the whole of effect.step() (includes the three above)
+- UPLOAD:     copying the frame into the strip's LED buffer
+- SHOW:       strip.show(), including waiting for the previous DMA transfer
+- SLEEP:      time the frame clock slept until the next deadline
+
+Effect switches are timed the same way (effect_switches): STOP is the time
+from signalling the running effect to its thread having exited, SWITCH the
+whole switch from the request to the new effect's thread running.
+
+The histograms are cumulative since start-up and served by /api/metrics as
+JSON or in the Prometheus text exposition format. When the effects run in a
+separate engine process (engine.py) the histograms are moved into shared
+memory with attach(), so the web process serves them without any copying.
+"""
+
+import bisect
+import os
+
+import numpy as np
+
+
+AUDIO_READ = 0
+ANALYSIS = 1
+MAPPING = 2
+RENDER = 3
+UPLOAD = 4
+SHOW = 5
+SLEEP = 6
+STAGE_NAMES = ('audio_read', 'analysis', 'mapping', 'render', 'upload', 'show', 'sleep')
+
+STOP = 0
+SWITCH = 1
+SWITCH_NAMES = ('stop', 'switch')
+
+# Upper bounds of the histogram buckets in seconds (plus an overflow bucket)
+BUCKET_BOUNDS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class stage_metrics():
+    """Latency histograms for the stages of the effect loop."""
+    def __init__(self, stage_names=STAGE_NAMES, bounds=BUCKET_BOUNDS,
+                 name='led_stage_seconds',
+                 description='Time spent in each stage of the LED effect loop.'):
+        self.stage_names = stage_names
+        self.name = name
+        self.description = description
+        self.bounds = list(bounds)
+        self.counts = np.zeros((len(stage_names), len(bounds) + 1), dtype=np.int64)
+        self.sums = np.zeros(len(stage_names), dtype=float)
+
+    def record(self, stage, seconds):
+        """Count one sample of stage (e.g. SHOW) taking seconds."""
+        self.counts[stage, bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sums[stage] += seconds
+
+    @property
+    def nbytes(self):
+        """Size of the histogram arrays in bytes, for attach()."""
+        return self.counts.nbytes + self.sums.nbytes
+
+    def attach(self, buffer, offset=0):
+        """Keep the histograms in buffer (e.g. shared memory) from now on.
+
+        The counts continue from whatever buffer holds, so several processes
+        attaching the same buffer share one set of histograms.
+
+        Returns:
+            The offset in buffer after the histograms.
+        """
+        self.counts = np.ndarray(self.counts.shape, self.counts.dtype, buffer, offset)
+        offset += self.counts.nbytes
+        self.sums = np.ndarray(self.sums.shape, self.sums.dtype, buffer, offset)
+        return offset + self.sums.nbytes
+
+    def reset(self):
+        self.counts[:] = 0
+        self.sums[:] = 0
+
+    def percentile(self, stage, q):
+        """Estimate the q-th percentile of a stage from its histogram.
+
+        Returns the upper bound of the bucket holding that sample (the last
+        bound for the overflow bucket), or None if nothing was recorded.
+        """
+        counts = self.counts[stage]
+        total = counts.sum()
+        if total == 0:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(counts), total * q / 100))
+        return self.bounds[min(bucket, len(self.bounds) - 1)]
+
+    def stats(self):
+        """Return count, mean and estimated p50/p99 per stage, in milliseconds."""
+        stats = {}
+        for stage, name in enumerate(self.stage_names):
+            count = int(self.counts[stage].sum())
+            p50 = self.percentile(stage, 50)
+            p99 = self.percentile(stage, 99)
+            stats[name] = {
+                'count': count,
+                'mean_ms': round(self.sums[stage] / count * 1000, 4) if count else None,
+                'p50_ms': p50 * 1000 if p50 is not None else None,
+                'p99_ms': p99 * 1000 if p99 is not None else None,
+                'buckets': {str(bound): int(n) for bound, n in
+                            zip(self.bounds + ['+Inf'], self.counts[stage])},
+            }
+        return stats
+
+    def prometheus_lines(self):
+        """Return the histograms in the Prometheus text format, as lines."""
+        name = self.name
+        lines = [f"# HELP {name} {self.description}",
+                 f"# TYPE {name} histogram"]
+        for stage, stage_name in enumerate(self.stage_names):
+            cumulative = np.cumsum(self.counts[stage])
+            for bound, count in zip(self.bounds + ['+Inf'], cumulative):
+                lines.append(f'{name}_bucket{{stage="{stage_name}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage_name}"}} {self.sums[stage]:.9f}')
+            lines.append(f'{name}_count{{stage="{stage_name}"}} {cumulative[-1]}')
+        return lines
+
+
+def process_age():
+    """Return the seconds since this process was started, or None if unknown.
+
+    Read from /proc, so it includes the interpreter's own start-up and the
+    imports before any of our code ran (to within a clock tick).
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # fields after the command name, which may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        start_ticks = int(fields[19])  # starttime, field 22 of stat
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def prometheus_text(histograms, effect=None, frame_stats=None, output_stats=None,
+                    startup_times=None):
+    """Format histograms plus the effect/output counters for Prometheus.
+
+    Args:
+        histograms: list of stage_metrics to export
+        effect: name of the running effect, used as a label
+        frame_stats: frame_clock.stats() of the running effect, if any
+        output_stats: framebuffer.stats() of the strip
+        startup_times: seconds from process start to each start-up phase
+    """
+    lines = []
+    for metrics in histograms:
+        lines += metrics.prometheus_lines()
+
+    if frame_stats:
+        label = f'{{effect="{effect}"}}'
+        gauges = (('led_effect_fps', 'Achieved frame rate of the running effect.', 'fps'),
+                  ('led_effect_target_fps', 'Target frame rate of the running effect.', 'target_fps'))
+        counters = (('led_effect_frames_total', 'Frames rendered by the running effect.', 'frames'),
+                    ('led_effect_late_frames_total', 'Frames that missed their deadline.', 'late_frames'),
+                    ('led_effect_dropped_frames_total', 'Frames dropped to catch up.', 'dropped_frames'))
+        for name, help_text, key in gauges:
+            if frame_stats.get(key) is not None:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge",
+                          f"{name}{label} {frame_stats[key]}"]
+        for name, help_text, key in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter",
+                      f"{name}{label} {frame_stats[key]}"]
+
+    if output_stats:
+        for key, help_text in (('shows_sent', 'Frames transmitted to the LEDs.'),
+                               ('shows_skipped', 'Unchanged frames not transmitted.')):
+            name = f'led_{key}_total'
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter",
+                      f"{name} {output_stats[key]}"]
+
+    if startup_times:
+        name = 'led_startup_seconds'
+        lines += [f"# HELP {name} Time from process start to each start-up phase.",
+                  f"# TYPE {name} gauge"]
+        lines += [f'{name}{{phase="{phase}"}} {seconds}'
+                  for phase, seconds in startup_times.items() if seconds is not None]
+
+    return '\n'.join(lines) + '\n'
+
+
+# Metrics of this process's effect loop
+hot_path = stage_metrics()
+effect_switches = stage_metrics(SWITCH_NAMES, name='led_effect_switch_seconds',
+                                description='Time taken to stop and to switch effects.')
@@ -0,0 +1,158 @@
+"""
+Several physical LED strips driven as one logical strip.
+
+The Pi has two PWM channels (GPIO 18 on channel 0, GPIO 13 on channel 1).
+Rather than one rpi_ws281x controller (and DMA channel) per strip, whose
+show() calls would each restart the PWM hardware and clock their strips out
+one after the other, both channels are configured on a single controller.
+One ws2811_render() then streams both channels through the PWM serialisers
+in parallel from one DMA transfer, so a frame takes as long as the longest
+strip rather than the sum of them.
+
+Pixels are numbered across the outputs in order: 0 to count_0 - 1 on the
+first output, then on into the second. Effects and the framebuffer see one
+strip of total_count pixels; the framebuffer copies each output's part of
+the frame into that channel's buffer (led_segments()).
+"""
+
+import atexit
+
+from framebuffer import channel_buffer
+
+
+class output_config():
+    """Wiring of one physical strip on a PWM channel."""
+    def __init__(self, count, pin, channel, invert=False, brightness=255, strip_type=None):
+        """
+        Args:
+            count: number of LEDs on the strip
+            pin: GPIO pin (18 for PWM channel 0, 13 for channel 1)
+            channel: PWM channel, 0 or 1
+            invert: True to invert the signal (NPN transistor level shift)
+            brightness: 0 (darkest) to 255 (brightest)
+            strip_type: rpi_ws281x strip type (default WS2811_STRIP_GRB)
+        """
+        self.count = count
+        self.pin = pin
+        self.channel = channel
+        self.invert = invert
+        self.brightness = brightness
+        self.strip_type = strip_type
+
+
+class multi_channel_strip():
+    """Up to two PWM strips on one rpi_ws281x controller, as one logical strip.
+
+    Implements the parts of the Adafruit_NeoPixel interface the app uses
+    (begin, show, numPixels, setPixelColor, getPixelColor).
+    """
+    def __init__(self, outputs, freq_hz=800000, dma=10):
+        """
+        Args:
+            outputs: list of output_config, at most one per PWM channel
+            freq_hz: LED signal frequency
+            dma: DMA channel used for both outputs
+        """
+        from rpi_ws281x import ws
+
+        if len({output.channel for output in outputs}) != len(outputs) or len(outputs) > 2:
+            raise ValueError("Each output needs its own PWM channel (0 or 1)")
+
+        self.ws = ws
+        self.outputs = outputs
+        self._leds = ws.new_ws2811_t()
+
+        for channum in range(2):
+            chan = ws.ws2811_channel_get(self._leds, channum)
+            ws.ws2811_channel_t_count_set(chan, 0)
+            ws.ws2811_channel_t_gpionum_set(chan, 0)
+            ws.ws2811_channel_t_invert_set(chan, 0)
+            ws.ws2811_channel_t_brightness_set(chan, 0)
+
+        self._channels = []
+        self.offsets = []
+        offset = 0
+        for output in outputs:
+            chan = ws.ws2811_channel_get(self._leds, output.channel)
+            ws.ws2811_channel_t_gamma_set(chan, list(range(256)))
+            ws.ws2811_channel_t_count_set(chan, output.count)
+            ws.ws2811_channel_t_gpionum_set(chan, output.pin)
+            ws.ws2811_channel_t_invert_set(chan, 1 if output.invert else 0)
+            ws.ws2811_channel_t_brightness_set(chan, output.brightness)
+            ws.ws2811_channel_t_strip_type_set(chan, output.strip_type
+                                               if output.strip_type is not None
+                                               else ws.WS2811_STRIP_GRB)
+            self._channels.append(chan)
+            self.offsets.append(offset)
+            offset += output.count
+
+        ws.ws2811_t_freq_set(self._leds, freq_hz)
+        ws.ws2811_t_dmanum_set(self._leds, dma)
+        self.size = offset
+        self.started = False
+
+        atexit.register(self._cleanup)
+
+    def _cleanup(self):
+        if self._leds is not None:
+            # ws2811_fini() crashes on a controller that was never initialised
+            if self.started:
+                self.ws.ws2811_fini(self._leds)
+            self.ws.delete_ws2811_t(self._leds)
+            self._leds = None
+            self._channels = []
+
+    def begin(self):
+        """Initialise the controller, must be called before anything else."""
+        resp = self.ws.ws2811_init(self._leds)
+        if resp != 0:
+            str_resp = self.ws.ws2811_get_return_t_str(resp)
+            raise RuntimeError(f'ws2811_init failed with code {resp} ({str_resp})')
+        self.started = True
+
+    def show(self):
+        """Start clocking out every output at once."""
+        resp = self.ws.ws2811_render(self._leds)
+        if resp != 0:
+            str_resp = self.ws.ws2811_get_return_t_str(resp)
+            raise RuntimeError(f'ws2811_render failed with code {resp} ({str_resp})')
+
+    def numPixels(self):
+        """Return the number of pixels across all outputs."""
+        return self.size
+
+    def locate(self, n):
+        """Return (channel, index on that channel) of logical pixel n."""
+        for output, chan, offset in zip(reversed(self.outputs), reversed(self._channels),
+                                        reversed(self.offsets)):
+            if n >= offset:
+                if n - offset >= output.count:
+                    break
+                return chan, n - offset
+        raise IndexError(f'pixel {n} is out of range')
+
+    def setPixelColor(self, n, color):
+        """Set logical pixel n to the provided 24-bit color value."""
+        chan, index = self.locate(n)
+        self.ws.ws2811_led_set(chan, index, color)
+
+    def getPixelColor(self, n):
+        """Get the 24-bit RGB color value of logical pixel n."""
+        chan, index = self.locate(n)
+        return self.ws.ws2811_led_get(chan, index)
+
+    def led_segments(self):
+        """Return [(first logical pixel, channel LED buffer), ...], or None before begin()."""
+        segments = []
+        for output, chan, offset in zip(self.outputs, self._channels, self.offsets):
+            buffer = channel_buffer(chan, output.count)
+            if buffer is None:
+                return None
+            segments.append((offset, buffer))
+        return segments
+
+    def output_info(self):
+        """Return the pin, channel and pixel range of each output."""
+        return [{'pin': output.pin, 'channel': output.channel,
+                 'first_pixel': offset, 'count': output.count}
+                for output, offset in zip(self.outputs, self.offsets)]
@@ -0,0 +1,68 @@
+"""
+Precomputed colour palette tables for the effects.
+
+Palettes are built once as read-only uint32 NumPy arrays of packed colours
+and cached by their definition, so switching effects does not rebuild them
+and pattern functions can map a whole array of intensities to colours with
+one gather (palette[intensities]).
+"""
+
+import functools
+
+import numpy as np
+
+from framebuffer import pack_colours
+
+
+def _palette_key(colour_sequence):
+    """Turn a list of [r, g, b] lists into a hashable tuple of tuples."""
+    return tuple(tuple(int(channel) for channel in colour) for colour in colour_sequence)
+
+
+@functools.lru_cache(maxsize=None)
+def _gradient_palette(colour_key, steps):
+    # channel multiplier (0 or 1) x brightness step, for every colour in turn
+    multipliers = np.array(colour_key, dtype=np.uint32).reshape(-1, 1, 3)
+    brightness = np.arange(steps, dtype=np.uint32).reshape(1, -1, 1)
+    channels = (multipliers * brightness).reshape(-1, 3)
+
+    palette = pack_colours(channels[:, 0], channels[:, 1], channels[:, 2])
+    palette.flags.writeable = False
+    return palette
+
+
+@functools.lru_cache(maxsize=None)
+def _intensity_palette(colour_key, steps):
+    palette = np.concatenate(([0], _gradient_palette(colour_key, steps))).astype(np.uint32)
+    palette.flags.writeable = False
+    return palette
+
+
+def gradient_palette(colour_sequence, steps=255):
+    """Return the brightness ramps of each colour in the sequence, back to back.
+
+    Args:
+        colour_sequence: list of [r, g, b] channel multipliers (0 or 1)
+        steps: brightness steps per colour, from 0 up to steps - 1
+
+    Returns:
+        Read-only uint32 array of len(colour_sequence) * steps packed colours.
+    """
+    return _gradient_palette(_palette_key(colour_sequence), steps)
+
+
+def intensity_palette(colour_sequence, steps=255):
+    """Return gradient_palette() with an extra "off" entry at index 0.
+
+    Indexing it with an intensity gives off for 0 and
+    gradient_palette(colour_sequence, steps)[intensity - 1] otherwise.
+    """
+    return _intensity_palette(_palette_key(colour_sequence), steps)
+
+
+def map_intensities(palette, intensities, out=None):
+    """Map an array of palette indices to colours in one step.
+
+    Indices beyond the end of the palette are clipped to the last entry.
+    """
+    return np.take(palette, intensities, out=out, mode='clip')
@@ -0,0 +1,129 @@
+"""
+Live preview of what the strip is showing, for the web UI.
+
+The preview never touches the effect thread: each connected client polls the
+framebuffer's last transmitted frame (framebuffer.last_sent) at its own
+PREVIEW_FPS and is sent a Server-Sent Event only when that frame changed.
+With no client connected there is no work at all.
+
+Frames are sent as base64 encoded binary, either in full or as a delta of
+the runs of LEDs that changed, whichever is smaller:
+
+- event "frame": the RGB bytes of every LED (3 bytes per LED)
+- event "delta": repeated [start uint16][count uint16][count * 3 RGB bytes],
+                 little-endian, applied to the previous frame
+
+A full frame is resent every KEYFRAME_INTERVAL events so a client that
+missed an event recovers.
+
+Each open stream keeps one of the web server's request threads busy for as
+long as the page is open, so at most MAX_PREVIEW_CLIENTS streams are served
+at once (client_limit) and the rest of the threads stay free for the
+control routes.
+"""
+
+import base64
+import threading
+import time
+
+import numpy as np
+
+from framebuffer import unpack_rgb
+
+
+PREVIEW_FPS = 15  # Default preview rate
+MAX_PREVIEW_FPS = 30
+KEYFRAME_INTERVAL = 100  # Events between full frames
+SSE_KEEPALIVE_INTERVAL = 15.0  # Seconds between comments on an idle stream
+MAX_PREVIEW_CLIENTS = 4  # Streams served at once (must be below the server's threads)
+
+
+class client_limit():
+    """Counts the open preview streams and refuses any beyond the limit."""
+    def __init__(self, limit=MAX_PREVIEW_CLIENTS):
+        self.limit = limit
+        self.clients = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a place for a new stream; returns False if all are taken."""
+        with self.lock:
+            if self.clients >= self.limit:
+                return False
+            self.clients += 1
+            return True
+
+    def release(self):
+        """Give back the place of a stream that has closed."""
+        with self.lock:
+            self.clients -= 1
+
+
+class preview_encoder():
+    """Encodes successive frames as full frames or deltas of changed runs."""
+    def __init__(self, num_pixels, keyframe_interval=KEYFRAME_INTERVAL):
+        self.num_pixels = num_pixels
+        self.keyframe_interval = keyframe_interval
+        self.previous = np.zeros(num_pixels, dtype=np.uint32)
+        self.current = np.zeros(num_pixels, dtype=np.uint32)
+        self.events = 0
+
+    def encode(self, pixels):
+        """Return (event, payload bytes) for the frame, or None if unchanged."""
+        np.copyto(self.current, pixels)
+        keyframe = self.events % self.keyframe_interval == 0
+
+        if keyframe:
+            event = ('frame', unpack_rgb(self.current).tobytes())
+        else:
+            changed = np.flatnonzero(self.current != self.previous)
+            if len(changed) == 0:
+                return None
+            event = self.delta(changed)
+
+        self.previous, self.current = self.current, self.previous
+        self.events += 1
+        return event
+
+    def delta(self, changed):
+        """Return the delta event for the changed LED indices (or a full frame)."""
+        # split the changed indices into runs of consecutive LEDs
+        breaks = np.flatnonzero(np.diff(changed) > 1) + 1
+        starts = changed[np.concatenate(([0], breaks))]
+        ends = changed[np.concatenate((breaks - 1, [len(changed) - 1]))] + 1
+
+        size = len(starts) * 4 + len(changed) * 3
+        if size >= self.num_pixels * 3:
+            return ('frame', unpack_rgb(self.current).tobytes())
+
+        rgb = unpack_rgb(self.current)
+        payload = bytearray()
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            payload += np.array([start, end - start], dtype='<u2').tobytes()
+            payload += rgb[start:end].tobytes()
+        return ('delta', bytes(payload))
+
+
+def preview_events(frame, fps=PREVIEW_FPS):
+    """Generate the Server-Sent Events of a live preview of frame.
+
+    Args:
+        frame: framebuffer whose transmitted frames are previewed
+        fps: preview rate, independent of the effect's frame rate
+    """
+    period = 1.0 / min(max(fps, 1), MAX_PREVIEW_FPS)
+    encoder = preview_encoder(len(frame.last_sent))
+    last_event = time.monotonic()
+
+    yield f"event: config\ndata: {len(frame.last_sent)}\n\n"
+    while True:
+        encoded = encoder.encode(frame.last_sent)
+        now = time.monotonic()
+        if encoded is not None:
+            event, payload = encoded
+            yield f"event: {event}\ndata: {base64.b64encode(payload).decode('ascii')}\n\n"
+            last_event = now
+        elif now - last_event >= SSE_KEEPALIVE_INTERVAL:
+            yield ": keep-alive\n\n"
+            last_event = now
+        time.sleep(period)
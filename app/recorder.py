@@ -0,0 +1,340 @@
+"""
+Recording and replay of the frames shown on the strip.
+
+A recorder attached to the strip's framebuffer appends every transmitted
+frame, with its time, to an append-only .ledshow file. The player effect
+memory-maps such a file and shows the frames again at the times they were
+recorded, so an audio-reactive show can be replayed (or shared with another
+Pi) without any of the audio capture and analysis behind it: a replayed
+frame is a slice of the file copied into the frame.
+
+File format (little-endian throughout):
+
+- header, HEADER_SIZE bytes: magic b'LEDSHOW1', format version (uint16),
+  flags (uint16, FLAG_DELTA), number of pixels (uint32), keyframe interval
+  (uint32), wall clock start time (float64 Unix time), then zero padding
+- records, one per frame: time since the start (float64 seconds), kind
+  (uint8, FULL_FRAME or DELTA_FRAME), payload size (uint32), payload
+
+A FULL_FRAME payload is the RGB bytes of every pixel (3 bytes per pixel).
+With FLAG_DELTA, frames in between keyframes are DELTA_FRAME payloads in the
+preview's delta encoding (preview.py): repeated [start uint16][count uint16]
+[count * 3 RGB bytes] applied to the previous frame. Without it every record
+is a full frame, so records have a fixed size and the file is read as one
+array.
+
+Usage:
+    frame.recorder = show_recorder(recording_path('gig'), frame.numPixels())
+    ...
+    frame.recorder.close()
+
+    player = show_player(strip, recording_path('gig'))
+    player.run(stop_event)
+"""
+
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from framebuffer import get_framebuffer, unpack_rgb
+from frame_clock import run_effect
+from preview import preview_encoder, KEYFRAME_INTERVAL
+
+
+MAGIC = b'LEDSHOW1'
+VERSION = 1
+FLAG_DELTA = 1  # frames between keyframes are stored as deltas
+
+HEADER = struct.Struct('<8sHHIId')
+HEADER_SIZE = 32
+RECORD = struct.Struct('<dBI')  # time, kind, payload size
+
+FULL_FRAME = 0
+DELTA_FRAME = 1
+
+RECORDING_EXTENSION = '.ledshow'
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+
+
+def recording_path(name):
+    """Return the path of the named recording in RECORDINGS_DIR.
+
+    Raises:
+        ValueError: if the name is not a plain file name
+    """
+    name = str(name)
+    if not name or os.path.basename(name) != name or name.startswith('.'):
+        raise ValueError(f'Invalid recording name: {name!r}')
+    if not name.endswith(RECORDING_EXTENSION):
+        name += RECORDING_EXTENSION
+    return os.path.join(RECORDINGS_DIR, name)
+
+
+def list_recordings():
+    """Return the name and size of every recording in RECORDINGS_DIR."""
+    if not os.path.isdir(RECORDINGS_DIR):
+        return []
+    return [{'name': name[:-len(RECORDING_EXTENSION)],
+             'bytes': os.path.getsize(os.path.join(RECORDINGS_DIR, name))}
+            for name in sorted(os.listdir(RECORDINGS_DIR))
+            if name.endswith(RECORDING_EXTENSION)]
+
+
+class show_recorder():
+    """Appends the frames shown on a strip to a recording file.
+
+    write() is called by framebuffer.show() on the thread driving the strip,
+    close() may be called from any other thread.
+    """
+    def __init__(self, path, num_pixels, delta=True, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        Args:
+            path: file to create (an existing file is not overwritten)
+            num_pixels: pixels per frame
+            delta: store the frames between keyframes as deltas
+            keyframe_interval: frames between full frames when delta is set
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.num_pixels = num_pixels
+        self.delta = delta
+        self.encoder = preview_encoder(num_pixels, keyframe_interval) if delta else None
+
+        self.file = open(path, 'xb')
+        header = HEADER.pack(MAGIC, VERSION, FLAG_DELTA if delta else 0, num_pixels,
+                             keyframe_interval, time.time())
+        self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+        self.lock = threading.Lock()
+        self.start_time = None
+        self.frames = 0
+        self.bytes = HEADER_SIZE
+
+    def write(self, pixels, now):
+        """Append a frame of packed colours shown at time.monotonic() now."""
+        with self.lock:
+            if self.file is None:
+                return
+            if self.start_time is None:
+                self.start_time = now
+
+            if self.encoder is not None:
+                encoded = self.encoder.encode(pixels)
+                if encoded is None:
+                    return  # unchanged (a keep-alive refresh)
+                event, payload = encoded
+                kind = FULL_FRAME if event == 'frame' else DELTA_FRAME
+            else:
+                kind, payload = FULL_FRAME, unpack_rgb(pixels).tobytes()
+
+            self.file.write(RECORD.pack(now - self.start_time, kind, len(payload)))
+            self.file.write(payload)
+            self.frames += 1
+            self.bytes += RECORD.size + len(payload)
+
+    def close(self):
+        """Stop recording and close the file."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        """Return the file name and how much has been recorded."""
+        return {
+            'name': os.path.basename(self.path)[:-len(RECORDING_EXTENSION)],
+            'frames': self.frames,
+            'bytes': self.bytes,
+            'seconds': round(time.monotonic() - self.start_time, 3) if self.start_time else 0.0,
+            'delta': self.delta,
+        }
+
+
+class show_recording():
+    """A recording file, memory-mapped and indexed for playback."""
+    def __init__(self, path):
+        """
+        Raises:
+            ValueError: if there is no such file or it is not a recording
+        """
+        if not os.path.isfile(path):
+            raise ValueError(f'No recording {os.path.basename(path)}')
+        # a plain ndarray view: slicing a memmap is slower, and the view
+        # keeps the mapping open
+        self.data = np.memmap(path, dtype=np.uint8, mode='r').view(np.ndarray)
+        if len(self.data) < HEADER_SIZE:
+            raise ValueError(f'{path} is not a recording')
+        magic, version, flags, num_pixels, keyframe_interval, start_time = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} recording')
+
+        self.num_pixels = num_pixels
+        self.delta = bool(flags & FLAG_DELTA)
+        self.start_time = start_time
+        self.frame_bytes = num_pixels * 3
+
+        if self.delta:
+            self.index_records()
+        else:
+            # fixed size records: view the whole file as one array
+            record_size = RECORD.size + self.frame_bytes
+            count = (len(self.data) - HEADER_SIZE) // record_size
+            records = np.ndarray(count, np.dtype([('time', '<f8'), ('kind', 'u1'),
+                                                  ('size', '<u4'),
+                                                  ('rgb', 'u1', (num_pixels, 3))]),
+                                 self.data, HEADER_SIZE)
+            self.times = records['time']
+            self.kinds = records['kind']
+            self.offsets = HEADER_SIZE + RECORD.size + np.arange(count) * record_size
+
+        self.keyframes = np.flatnonzero(self.kinds == FULL_FRAME)
+
+    def index_records(self):
+        """Find the time, kind and payload offset of every (complete) record."""
+        times, kinds, offsets, sizes = [], [], [], []
+        offset = HEADER_SIZE
+        end = len(self.data)
+        while offset + RECORD.size <= end:
+            record_time, kind, size = RECORD.unpack_from(self.data, offset)
+            offset += RECORD.size
+            if offset + size > end:
+                break  # cut off while recording
+            times.append(record_time)
+            kinds.append(kind)
+            offsets.append(offset)
+            sizes.append(size)
+            offset += size
+
+        self.times = np.array(times, dtype=float)
+        self.kinds = np.array(kinds, dtype=np.uint8)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.sizes = np.array(sizes, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.times)
+
+    def duration(self):
+        """Return the time of the last frame in seconds."""
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    def frame_period(self):
+        """Return the typical time between frames."""
+        if len(self.times) < 2:
+            return 0.1
+        return max(float(np.median(np.diff(self.times))), 0.001)
+
+    def apply(self, index, pixels):
+        """Apply record index to pixels (uint32, packed colours) in place."""
+        channels = pixels.view(np.uint8).reshape(-1, 4)  # B, G, R, W per pixel
+        offset = int(self.offsets[index])
+
+        if self.kinds[index] == FULL_FRAME:
+            rgb = self.data[offset:offset + self.frame_bytes].reshape(-1, 3)
+            channels[:, 2] = rgb[:, 0]
+            channels[:, 1] = rgb[:, 1]
+            channels[:, 0] = rgb[:, 2]
+            channels[:, 3] = 0
+            return
+
+        end = offset + int(self.sizes[index])
+        while offset < end:
+            start, count = struct.unpack_from('<HH', self.data, offset)
+            offset += 4
+            rgb = self.data[offset:offset + count * 3].reshape(-1, 3)
+            offset += count * 3
+            channels[start:start + count, 2] = rgb[:, 0]
+            channels[start:start + count, 1] = rgb[:, 1]
+            channels[start:start + count, 0] = rgb[:, 2]
+            channels[start:start + count, 3] = 0
+
+
+class show_player():
+    """Effect replaying a recording at the times its frames were shown."""
+    def __init__(self, strip, path, loop=True, seek=0.0):
+        """
+        Args:
+            strip: The LED strip object (or a zone of it)
+            path: recording file
+            loop: start again from the beginning at the end, otherwise finish
+            seek: position to start from, in seconds
+        """
+        self.strip = strip
+        self.frame = get_framebuffer(strip)
+        self.recording = show_recording(path)
+        if len(self.recording) == 0:
+            raise ValueError(f'{path} has no frames')
+        self.loop = loop
+        self.frame_period = self.recording.frame_period()
+
+        self.pixels = np.zeros(self.recording.num_pixels, dtype='<u4')
+        self.position = -1  # index of the record in self.pixels
+        self.start_time = None
+        self.seek_to = seek
+        self.done = False
+
+    def seek(self, seconds):
+        """Continue playing from seconds into the recording."""
+        self.seek_to = seconds
+
+    def finished(self):
+        return self.done
+
+    def show_record(self, index):
+        """Bring self.pixels to record index, from the nearest keyframe if needed."""
+        recording = self.recording
+        keyframe = recording.keyframes[np.searchsorted(recording.keyframes, index, 'right') - 1]
+        if index < self.position or keyframe > self.position:
+            self.position = keyframe - 1
+        for record in range(self.position + 1, index + 1):
+            recording.apply(record, self.pixels)
+        self.position = index
+
+    def step(self):
+        """Show the frame due at the current playing time."""
+        now = time.monotonic()
+        if self.seek_to is not None:
+            self.start_time = now - self.seek_to
+            self.seek_to = None
+        elapsed = now - self.start_time
+
+        duration = self.recording.duration()
+        if elapsed > duration + self.frame_period:
+            if not self.loop:
+                self.done = True
+                return
+            self.start_time = now
+            elapsed = 0.0
+
+        index = max(int(np.searchsorted(self.recording.times, elapsed, 'right')) - 1, 0)
+        if index != self.position:
+            self.show_record(index)
+            count = min(len(self.pixels), self.frame.numPixels())
+            np.copyto(self.frame.pixels[:count], self.pixels[:count])
+
+    def run(self, stop_event=None):
+        """Play the recording until it ends (without loop) or stop_event is set.
+
+        Args:
+            stop_event: threading.Event that signals when to stop the effect
+        """
+        run_effect(self, stop_event, until=self.finished)
+
+
+def check_player_params(params):
+    """Check of the 'replay' effect's parameters: the recording has to exist.
+
+    Raises:
+        ValueError: if the name is invalid or there is no such recording
+    """
+    if not os.path.isfile(recording_path(params['file'])):
+        raise ValueError(f"No recording {params['file']}")
+
+
+def create_player(target, params):
+    """Factory of the 'replay' effect (see effect_registry.py)."""
+    return show_player(target, recording_path(params['file']),
+                       loop=params.get('loop', True), seek=params.get('seek') or 0.0)
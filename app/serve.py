@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Production server for the LED controller.
+
+Serves the same routes as main.py from a multi-threaded WSGI server
+(waitress, falling back to Werkzeug's threaded server if it is not
+installed) instead of the Flask development server. The control routes only
+queue their command and return 202 with its id; the command worker thread
+does the effect switching and LED writes. Logs are written to stdout as one
+JSON object per line.
+
+Only one process can drive the strip. By default that is the server
+process itself; with --engine-process the effects run in a child process
+that owns the strip (engine.py), so request handling never holds up a frame.
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5000] [--threads 8] [--preview-clients 4]
+                    [--engine-process]
+
+Every open live preview (/api/preview) holds one of the request threads, so
+--preview-clients has to be below --threads; the remaining threads serve the
+control routes however many pages are open.
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import signal
+import sys
+
+from preview import MAX_PREVIEW_CLIENTS
+
+
+# Attributes every LogRecord has; anything else was passed with extra=
+STANDARD_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message'}
+
+
+class json_formatter(logging.Formatter):
+    """Formats log records as JSON, including any extra= fields."""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items()
+                      if key not in STANDARD_RECORD_FIELDS})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=logging.INFO):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(json_formatter())
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8, help='request handler threads')
+    parser.add_argument('--preview-clients', type=int, default=MAX_PREVIEW_CLIENTS,
+                        help='live preview streams served at once (each holds a thread)')
+    parser.add_argument('--engine-process', action='store_true',
+                        help='run the effects in a separate process')
+    args = parser.parse_args()
+    if not 0 <= args.preview_clients < args.threads:
+        parser.error('--preview-clients must be below --threads')
+
+    configure_logging()
+    log = logging.getLogger('led_controller')
+
+    if args.engine_process:
+        from engine import ENGINE_ENV
+        os.environ[ENGINE_ENV] = '1'
+    import main as controller
+    controller.app.config['ENQUEUE_COMMANDS'] = True
+    controller.preview_clients.limit = args.preview_clients
+
+    atexit.register(controller.cleanup)
+
+    def signal_handler(sig, frame):
+        log.info('shutting down', extra={'signal': sig})
+        sys.exit(0)  # runs cleanup() through atexit
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    controller.startup()
+
+    try:
+        import waitress
+    except ImportError:
+        waitress = None
+
+    log.info('serving', extra={'host': args.host, 'port': args.port, 'threads': args.threads,
+                               'preview_clients': args.preview_clients,
+                               'server': 'waitress' if waitress else 'werkzeug',
+                               'engine_process': controller.ENGINE_PROCESS})
+    if waitress is not None:
+        waitress.serve(controller.app, host=args.host, port=args.port, threads=args.threads)
+    else:
+        from werkzeug.serving import make_server
+        log.warning('waitress is not installed, using the threaded Werkzeug server')
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no per-request lines
+        make_server(args.host, args.port, controller.app, threaded=True).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
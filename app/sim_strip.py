@@ -0,0 +1,99 @@
+"""
+Simulated LED strip for running effects without hardware.
+
+simulated_strip implements the part of the rpi_ws281x Adafruit_NeoPixel
+interface the effects use (numPixels, setPixelColor, getPixelColor, begin,
+show), keeps the most recent frames in memory and can model how long a real
+show() takes to clock the data out to the LEDs.
+
+Like ws2811_render(), show() starts the transfer and returns straight away; it
+only blocks when the previous transfer has not finished yet. With channels=2
+the LEDs are split over two outputs clocked out in parallel, like a
+multi_channel_strip, so a transfer takes as long as one half.
+"""
+
+import time
+
+import numpy as np
+
+
+LED_BITS = 24             # bits sent per RGB LED
+LED_RESET_SECONDS = 55e-6  # latch time after each transfer (rpi_ws281x LED_RESET_uS)
+
+
+def transfer_seconds(num_pixels, freq_hz=800000):
+    """Return the time needed to send one frame to num_pixels LEDs."""
+    return num_pixels * LED_BITS / freq_hz + LED_RESET_SECONDS
+
+
+class simulated_strip():
+    """In-memory stand-in for an Adafruit_NeoPixel strip."""
+    def __init__(self, num, freq_hz=800000, model_transfer=True, record_frames=100,
+                 channels=1):
+        """
+        Args:
+            num: number of LEDs (across all channels)
+            freq_hz: LED signal frequency used to model the transfer time
+            model_transfer: make show() take as long as real hardware would
+            record_frames: number of most recent frames kept in memory
+            channels: number of parallel outputs the LEDs are split over
+        """
+        self.size = num
+        self.freq_hz = freq_hz
+        self.model_transfer = model_transfer
+        self.leds = np.zeros(num, dtype=np.uint32)
+
+        # Preallocated ring of the most recent frames shown
+        self.recorded = np.zeros((record_frames, num), dtype=np.uint32)
+        self.recorded_times = np.zeros(record_frames, dtype=float)
+        self.shows = 0
+
+        # one buffer per output, like separate rpi_ws281x channel buffers
+        self.channel_size = -(-num // channels)
+        self.segments = [(start, self.leds[start:start + self.channel_size])
+                         for start in range(0, num, self.channel_size)]
+
+        self.transfer_time = transfer_seconds(self.channel_size, freq_hz)
+        self.busy_until = 0.0
+        self.wait_time = 0.0  # total time show() spent waiting for the previous transfer
+
+    def begin(self):
+        """Nothing to initialise, kept for interface compatibility."""
+
+    def numPixels(self):
+        """Return the number of pixels in the display."""
+        return self.size
+
+    def setPixelColor(self, n, color):
+        """Set LED at position n to the provided 24-bit color value."""
+        self.leds[n] = color
+
+    def getPixelColor(self, n):
+        """Get the 24-bit RGB color value for the LED at position n."""
+        return int(self.leds[n])
+
+    def led_segments(self):
+        """Return the per-output LED buffers for framebuffer bulk uploads."""
+        return self.segments
+
+    def show(self):
+        """Record the LED buffer as a frame and model its transfer."""
+        now = time.monotonic()
+        if self.model_transfer:
+            if now < self.busy_until:
+                # previous transfer still running, wait for it like ws2811_wait()
+                time.sleep(self.busy_until - now)
+                self.wait_time += self.busy_until - now
+                now = self.busy_until
+            self.busy_until = now + self.transfer_time
+
+        slot = self.shows % len(self.recorded)
+        self.recorded[slot] = self.leds
+        self.recorded_times[slot] = now
+        self.shows += 1
+
+    def frames(self):
+        """Return the recorded frames and their times, oldest first."""
+        count = min(self.shows, len(self.recorded))
+        order = (np.arange(self.shows - count, self.shows)) % len(self.recorded)
+        return self.recorded[order], self.recorded_times[order]
@@ -1,11 +1,13 @@
 import time
 from rpi_ws281x import *
 import argparse
-from collections import deque
 import random
 import math
+import functools
 import numpy as np
 
+from framebuffer import get_framebuffer
+from frame_clock import run_effect
 from four_meter import LED_COUNT, LED_PIN, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL
 
 
@@ -14,24 +16,62 @@ def colorWipe(strip, color, wait_ms=50):
 
     """Wipe color across display a pixel at a time."""
 
-    for i in range(strip.numPixels()):
+    frame = get_framebuffer(strip)
 
-        strip.setPixelColor(i, color)
+    for i in range(frame.numPixels()):
 
-        strip.show()
+        frame.pixels[i] = color
+
+        frame.show()
 
         time.sleep(wait_ms/1000.0)
 
 
-def set_all(strip, color):
+class color_wipe():
+    def __init__(self, strip, colors, wait_ms=50):
+        """Wipe each colour in turn across the strip a pixel at a time, then finish.
 
-    """Set all pixels to the same color."""
+        The run-to-completion counterpart of colorWipe(), for running on the
+        output owner thread where a command can interrupt it.
 
-    for i in range(strip.numPixels()):
+        Args:
+            strip: The LED strip object
+            colors: Colours to wipe, one after the other
+            wait_ms: time per pixel in milliseconds
+        """
+        self.strip = strip
+        self.frame = get_framebuffer(strip)
+        self.colors = colors
+        self.frame_period = wait_ms / 1000.0
+        self.position = 0  # pixels wiped so far, over all the colours
+
+    def finished(self):
+        return self.position >= len(self.colors) * self.frame.numPixels()
+
+    def step(self):
+        """Wipe the next pixel."""
+        if self.finished():
+            return
+        color_index, pixel = divmod(self.position, self.frame.numPixels())
+        self.frame.pixels[pixel] = self.colors[color_index]
+        self.position += 1
 
-        strip.setPixelColor(i, color)
+    def run(self, stop_event=None):
+        """Run the wipe until it has finished or stop_event is set.
 
-    strip.show()
+        Args:
+            stop_event: threading.Event that signals when to stop the effect
+        """
+        run_effect(self, stop_event, until=self.finished)
+
+
+def set_all(strip, color):
+
+    """Set all pixels to the same color."""
+
+    frame = get_framebuffer(strip)
+    frame.fill(color)
+    frame.show()
 
 
 def hexstringcolor(hexstring):
@@ -50,20 +90,25 @@ def randomColor():
 class flame():
     def __init__(self, strip, back_color, outer_flame_color, inner_flame_color):
         self.strip = strip
+        self.frame = get_framebuffer(strip)
         self.back_color = back_color
         self.outer_flame_color = outer_flame_color
         self.inner_flame_color = inner_flame_color
-        self.inner_flame_base_ht = int(LED_COUNT * 0.3)
-        self.outer_flame_base_ht = int(LED_COUNT *0.7)
+        self.inner_flame_base_ht = int(self.frame.numPixels() * 0.3)
+        self.outer_flame_base_ht = int(self.frame.numPixels() * 0.7)
         self.flicker_ht = 10
+        self.frame_period = 0.1  # seconds per frame
     
-    def show(self, outer_ht, inner_ht):
-        set_all(self.strip, self.back_color)
-        for i in range(outer_ht):
-            self.strip.setPixelColor(i, self.outer_flame_color)
-        for i in range(inner_ht):
-            self.strip.setPixelColor(i, self.inner_flame_color)
-        self.strip.show()
+    def draw(self, outer_ht, inner_ht):
+        self.frame.fill(self.back_color)
+        self.frame.fill(self.outer_flame_color, 0, outer_ht)
+        self.frame.fill(self.inner_flame_color, 0, inner_ht)
+
+    def step(self):
+        """Render the next frame of the flame."""
+        outer_ht = self.outer_flame_base_ht + random.randint(0, self.flicker_ht)
+        inner_ht = self.inner_flame_base_ht + random.randint(0, self.flicker_ht)
+        self.draw(outer_ht, inner_ht)
 
     def run(self, stop_event=None):
         """Run the flame effect continuously until stop_event is set.
@@ -71,11 +116,7 @@ class flame():
         Args:
             stop_event: threading.Event that signals when to stop the effect
         """
-        while not (stop_event and stop_event.is_set()):
-            outer_ht = self.outer_flame_base_ht + random.randint(0, self.flicker_ht)
-            inner_ht = self.inner_flame_base_ht + random.randint(0, self.flicker_ht)
-            self.show(outer_ht, inner_ht)
-            time.sleep(0.1)
+        run_effect(self, stop_event)
         
 
 def sequence_between_colours(color1, color2, steps):
@@ -117,13 +158,18 @@ class expanding_waves():
 
         self.wave_length = 10  # number of LEDs per wave
         self.wave_speed = 0.05  # seconds per step
+        self.frame_period = self.wave_speed
+
+        self.frame = get_framebuffer(strip)
 
         self.center_position = int(center * strip.numPixels())
-        self.upper_len = strip.numPixels() - self.center_position - 1
-        self.lower_len = self.center_position - 1
+        self.upper_len = max(strip.numPixels() - self.center_position - 1, 0)
+        self.lower_len = max(self.center_position - 1, 0)
 
-        self.upper_ledarray = deque([self.back_colour] * self.upper_len)
-        self.lower_ledarray = deque([self.back_colour] * self.lower_len)
+        # LED colours either side of the centre, nearest the centre at the
+        # start of upper_ledarray and at the end of lower_ledarray
+        self.upper_ledarray = np.full(self.upper_len, self.back_colour, dtype=np.uint32)
+        self.lower_ledarray = np.full(self.lower_len, self.back_colour, dtype=np.uint32)
 
         self.wave_sequence = sequence_between_colours(self.wave_trough_color, self.wave_peak_color, int(self.wave_length / 2))
         self.wave_sequence += sequence_between_colours(self.wave_peak_color, self.wave_trough_color, int(self.wave_length / 2))
@@ -153,21 +199,28 @@ class expanding_waves():
 
 
     def step_wave(self):
+        new_colour = self.wave_sequence[self.wave_seq_position]
+
         if self.lower_len > 0:
-            self.lower = self.lower_ledarray.popleft()
-            self.lower_ledarray.append(self.wave_sequence[self.wave_seq_position])
-            [self.strip.setPixelColor((self.center_position -1)- idx, this_led) 
-                for idx,this_led in enumerate(reversed(self.lower_ledarray))]
+            # shift outwards (towards LED 0) and feed the new colour in at the centre
+            self.lower_ledarray[:-1] = self.lower_ledarray[1:]
+            self.lower_ledarray[-1] = new_colour
+            self.frame.pixels[self.center_position - self.lower_len:self.center_position] = self.lower_ledarray
 
         if self.upper_len > 0:
-            self.upper = self.upper_ledarray.pop()
-            self.upper_ledarray.appendleft(self.wave_sequence[self.wave_seq_position])
-            [self.strip.setPixelColor(self.center_position + 1+ idx, this_led) 
-                for idx,this_led in enumerate(self.upper_ledarray)]
+            # shift outwards (towards the far end) and feed the new colour in at the centre
+            self.upper_ledarray[1:] = self.upper_ledarray[:-1]
+            self.upper_ledarray[0] = new_colour
+            self.frame.pixels[self.center_position + 1:self.center_position + 1 + self.upper_len] = self.upper_ledarray
         
         self.wave_seq_position = (self.wave_seq_position + 1) % len(self.wave_sequence)
 
 
+    def step(self):
+        """Render the next frame of the waves."""
+        if self.center_position < self.frame.numPixels():
+            self.frame.pixels[self.center_position] = self.center_colour
+        self.step_wave()
 
 
     def run(self, stop_event=None):
@@ -177,22 +230,15 @@ class expanding_waves():
             stop_event: threading.Event that signals when to stop the effect
         """
         # set_all(self.strip, self.wave_trough_color)
-        self.strip.setPixelColor(self.center_position, self.center_colour)
-
-        while not (stop_event and stop_event.is_set()):
-            self.step_wave()
-            self.strip.show()
-            time.sleep(self.wave_speed)
+        run_effect(self, stop_event)
             
 
-def heart_beat(strip, color1, color2, stop_event=None):
-    """Create a heart beat effect by alternating between two colors.
-    
-    Args:
-        strip: The LED strip object
-        color1: First color for the beat
-        color2: Second color for the beat
-        stop_event: threading.Event that signals when to stop the effect
+@functools.lru_cache(maxsize=1)
+def heart_beat_series():
+    """Return the brightness waveform of one heart beat as a float array.
+
+    If the value is positive it is color1, if negative it is color2,
+    the brightness defined by the absolute value of the number.
     """
     end_b4_rounding = 250
     
@@ -210,29 +256,90 @@ def heart_beat(strip, color1, color2, stop_event=None):
     
     full_series = starting_hyperbola_series + top_half_circle_series + cube_series + bottom_half_circle_series + finishing_hyperbola_series
 
+    full_series = np.array(full_series, dtype=float)
+    full_series.flags.writeable = False
+    return full_series
+
+
+HEART_BEAT_INTERVAL = 0.015  # seconds per step of heart_beat_series()
+
+
+@functools.lru_cache(maxsize=16)
+def heart_beat_table(color1, color2, steps=None):
+    """Compile one heart beat into a table of packed colours, one per step.
+
+    Args:
+        color1: Colour for the positive half of the waveform
+        color2: Colour for the negative half of the waveform
+        steps: number of steps to resample the beat to (default: one per
+               waveform value)
+
+    Returns:
+        Read-only uint32 array of colours, cached by (color1, color2, steps).
+    """
+    series = heart_beat_series()
+    if steps is not None and steps != len(series):
+        series = np.interp(np.linspace(0, len(series) - 1, steps),
+                           np.arange(len(series)), series)
+
+    positive = series >= 0
+    magnitude = np.abs(series)
+    table = np.zeros(len(series), dtype=np.uint32)
+    for shift in (16, 8, 0):
+        channel = np.where(positive, (color1 >> shift) & 0xff, (color2 >> shift) & 0xff)
+        # int() in the original per-step Color() construction truncated
+        table |= np.trunc(channel * magnitude / 255).astype(np.uint32) << shift
+
+    table.flags.writeable = False
+    return table
+
+
+class heart_beat_effect():
+    def __init__(self, strip, color1, color2, frame_period=HEART_BEAT_INTERVAL):
+        """Create a heart beat effect by alternating between two colors.
+
+        Args:
+            strip: The LED strip object
+            color1: First color for the beat
+            color2: Second color for the beat
+            frame_period: seconds per frame, the beat is resampled so that it
+                          keeps the same duration at any frame rate
+        """
+        self.strip = strip
+        self.frame = get_framebuffer(strip)
+        self.color1 = color1
+        self.color2 = color2
+        self.frame_period = frame_period
+
+        beat_duration = len(heart_beat_series()) * HEART_BEAT_INTERVAL
+        steps = max(int(round(beat_duration / frame_period)), 1)
+        self.beat_table = heart_beat_table(int(color1), int(color2), steps)
+        self.series_position = 0
+
+    def step(self):
+        """Render the next frame of the beat."""
+        self.frame.fill(self.beat_table[self.series_position])
+        self.series_position = (self.series_position + 1) % len(self.beat_table)
+
+    def run(self, stop_event=None):
+        """Run the heart beat continuously until stop_event is set.
+
+        Args:
+            stop_event: threading.Event that signals when to stop the effect
+        """
+        run_effect(self, stop_event)
+
+
+def heart_beat(strip, color1, color2, stop_event=None):
+    """Create a heart beat effect by alternating between two colors.
     
-    # if the value is positive it is color1, if negative it is color2
-    # the brightness defined by the absolute value of the number
-    beat_interval = 0.015
-
-    while not (stop_event and stop_event.is_set()):
-        for value in full_series:
-            if stop_event and stop_event.is_set():
-                break
-                
-            if value >= 0:
-                set_all(strip, Color(
-                    int((color1.r * value) / 255),
-                    int((color1.g * value) / 255),
-                    int((color1.b * value) / 255),
-                ))
-            else:
-                set_all(strip, Color(
-                    int((color2.r * -value) / 255),
-                    int((color2.g * -value) / 255),
-                    int((color2.b * -value) / 255),
-                ))
-            time.sleep(beat_interval)
+    Args:
+        strip: The LED strip object
+        color1: First color for the beat
+        color2: Second color for the beat
+        stop_event: threading.Event that signals when to stop the effect
+    """
+    heart_beat_effect(strip, color1, color2).run(stop_event)
 
 
 
@@ -241,11 +348,34 @@ INNER_FLAME_COLOUR = hexstringcolor("FFFB00")
 OUTER_FLAME_COLOUR = hexstringcolor("FF0000")
 POSITIVE_BEAT_COLOUR = hexstringcolor("FF3500")
 NEGATIVE_BEAT_COLOUR = hexstringcolor("FF1500")
+SELF_TEST_WAIT_MS = 10  # time per pixel of the start-up self-test
 
 inner_flame_base_ht = 15
 outer_flame_base_ht = 40
 flicker_ht = 10
 
+
+# Factories of the effects in effect_registry.py
+
+def create_heart_beat(target, params):
+    return heart_beat_effect(target, NEGATIVE_BEAT_COLOUR, POSITIVE_BEAT_COLOUR)
+
+
+def create_expanding_waves(target, params):
+    return expanding_waves(target, 0.5, BACKCOLOUR, OUTER_FLAME_COLOUR)
+
+
+def create_flame(target, params):
+    return flame(target, BACKCOLOUR, OUTER_FLAME_COLOUR, INNER_FLAME_COLOUR)
+
+
+def create_self_test(target, params):
+    # light every LED yellow, then turn them all off again
+    wait_ms = params.get('wait_ms')
+    return color_wipe(target, [Color(255, 255, 0), Color(0, 0, 0)],
+                      SELF_TEST_WAIT_MS if wait_ms is None else wait_ms)
+
+
 # Main program logic follows:
 if __name__ == '__main__':
 
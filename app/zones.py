@@ -0,0 +1,169 @@
+"""
+Zones: independent effects on ranges of one strip.
+
+A zone is a named range of pixels that an effect draws on as if it were a
+strip of its own: it has numPixels() and a framebuffer (found by
+get_framebuffer()) whose pixels are a view onto the zone's slice of the
+strip's frame. Effects therefore draw straight into the shared frame, with
+no copying.
+
+A zone_layout runs the effects of all its zones from one render loop: every
+frame it steps each zone's effect that is due (each keeps its own frame
+period) and then shows the whole frame once, so any number of zones cost a
+single upload and show() per frame and no extra threads.
+
+Usage:
+    layout = zone_layout(get_framebuffer(strip))
+    left = layout.add_zone('left', 0, 100)
+    right = layout.add_zone('right', 100, 260)
+    layout.set_effect(left, 'flame', ve.flame(left, ...))
+    layout.set_effect(right, 'audio_frequency', ae.create_frequency_controller(right))
+    layout.run(stop_event)
+"""
+
+import time
+
+from frame_clock import run_effect
+from compositor import start_effect_hooks, stop_effect_hooks
+
+
+class zone_frame():
+    """The part of a framebuffer belonging to one zone.
+
+    Effects use it like a framebuffer. show() does nothing, as the zone
+    layout shows the whole frame once all zones have been drawn.
+    """
+    def __init__(self, frame, start, stop):
+        self.start = start
+        self.stop = stop
+        self.retarget(frame)
+
+    def retarget(self, frame):
+        """Draw into the same range of another framebuffer (e.g. off-screen during a crossfade)."""
+        self.pixels = frame.pixels[self.start:self.stop]
+
+    def numPixels(self):
+        """Return the number of pixels in the zone."""
+        return len(self.pixels)
+
+    def fill(self, color, start=0, stop=None):
+        """Set a range of the zone's pixels (default: all of them) to one colour."""
+        self.pixels[start:stop] = color
+
+    def show(self, force=False):
+        return False
+
+
+class zone():
+    """A named range of pixels, standing in for the strip of the effect drawn on it."""
+    def __init__(self, name, frame, start, stop):
+        """
+        Args:
+            name: name of the zone
+            frame: framebuffer of the strip
+            start: first pixel of the zone
+            stop: pixel after the last one of the zone
+        """
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.framebuffer = zone_frame(frame, start, stop)
+
+    def numPixels(self):
+        """Return the number of pixels in the zone."""
+        return self.stop - self.start
+
+
+class zone_layout():
+    """Runs an effect on each of a set of non-overlapping zones of one frame."""
+    def __init__(self, frame):
+        """
+        Args:
+            frame: framebuffer of the strip the zones divide up
+        """
+        self._frame = frame
+        self.zones = []
+        self.effects = {}       # zone name -> effect object
+        self.effect_names = {}  # zone name -> effect name
+        self.due = {}           # zone name -> time of the effect's next step
+
+    @property
+    def frame(self):
+        return self._frame
+
+    @frame.setter
+    def frame(self, frame):
+        # Retargeted by the crossfade compositor; the zones follow
+        self._frame = frame
+        for z in self.zones:
+            z.framebuffer.retarget(frame)
+
+    @property
+    def frame_period(self):
+        """Frame period of the layout, that of its fastest effect."""
+        periods = [effect.frame_period for effect in self.effects.values()]
+        return min(periods) if periods else 0.1
+
+    def add_zone(self, name, start, stop):
+        """Add a zone covering pixels start to stop - 1 and return it.
+
+        Raises:
+            ValueError: if the name is taken or the range is empty, outside
+                        the frame or overlaps another zone
+        """
+        if any(z.name == name for z in self.zones):
+            raise ValueError(f'Duplicate zone: {name}')
+        if not 0 <= start < stop <= self._frame.numPixels():
+            raise ValueError(f'Zone {name} ({start}-{stop}) is outside the strip '
+                             f'(0-{self._frame.numPixels()})')
+        for z in self.zones:
+            if start < z.stop and z.start < stop:
+                raise ValueError(f'Zone {name} ({start}-{stop}) overlaps zone {z.name} '
+                                 f'({z.start}-{z.stop})')
+
+        new_zone = zone(name, self._frame, start, stop)
+        self.zones.append(new_zone)
+        return new_zone
+
+    def set_effect(self, z, effect_name, effect):
+        """Make effect (drawing on zone z) the one shown in that zone."""
+        self.effects[z.name] = effect
+        self.effect_names[z.name] = effect_name
+
+    def step(self):
+        now = time.monotonic()
+
+        # step each zone's effect on its own period, skipping any missed frames
+        for name, effect in self.effects.items():
+            if now >= self.due[name]:
+                effect.step()
+                self.due[name] = max(self.due[name] + effect.frame_period, now)
+
+    def start(self):
+        """Start the effects' hooks (e.g. audio capture) for driving step()."""
+        now = time.monotonic()
+        for name, effect in self.effects.items():
+            start_effect_hooks(effect)
+            self.due[name] = now
+
+    def stop(self):
+        for effect in self.effects.values():
+            stop_effect_hooks(effect)
+
+    def run(self, stop_event=None):
+        """Run the zones' effects and show the frame until stop_event is set.
+
+        Args:
+            stop_event: threading.Event that signals when to stop the effects
+        """
+        self.start()
+        try:
+            run_effect(self, stop_event)
+        finally:
+            self.stop()
+
+    def zone_info(self):
+        """Return the name, pixel range and effect of each zone."""
+        return [{'name': z.name, 'start': z.start, 'stop': z.stop,
+                 'effect': self.effect_names.get(z.name)}
+                for z in self.zones]